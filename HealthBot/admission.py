@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+
+import metrics
+import nlp_service
+
+# Limits, all overridable from the environment:
+# messages per second each user may send on average, and how many in a burst
+USER_RATE = float(os.environ.get('HEALTHBOT_USER_RATE', 1.0))
+USER_BURST = int(os.environ.get('HEALTHBOT_USER_BURST', 5))
+# The same for each address calling the API server, counted per message so
+# a batch of n texts takes n; the burst must hold the largest batch
+CLIENT_RATE = float(os.environ.get('HEALTHBOT_CLIENT_RATE', 10.0))
+CLIENT_BURST = int(os.environ.get('HEALTHBOT_CLIENT_BURST', 64))
+# spaCy parses running at once in this process, how many more may wait for
+# a turn, and how long (seconds) they wait before giving up. With parser
+# processes the default leaves room for a full micro-batch per process.
+NLP_CONCURRENCY = int(os.environ.get('HEALTHBOT_NLP_CONCURRENCY',
+                                     max(2, nlp_service.WORKERS * nlp_service.MAX_BATCH)))
+NLP_QUEUE_SIZE = int(os.environ.get('HEALTHBOT_NLP_QUEUE', 16))
+NLP_WAIT = float(os.environ.get('HEALTHBOT_NLP_WAIT', 2.0))
+# Characters of a message that are looked at; the rest is cut off
+MAX_INPUT_LENGTH = int(os.environ.get('HEALTHBOT_MAX_INPUT', 1000))
+# Buckets kept before idle (full) ones are dropped
+MAX_TRACKED_USERS = 10000
+
+RATE_LIMITED_RESPONSE = "You're sending messages a little too quickly. Please wait a moment and try again."
+BUSY_RESPONSE = "I'm answering a lot of questions right now. Please try again in a moment."
+
+_outcomes = {
+    outcome: metrics.counter('healthbot_admission_total', 'Requests limited or degraded by admission control.',
+                             outcome=outcome)
+    for outcome in ('rate_limited', 'truncated', 'degraded', 'busy')
+}
+
+
+def count(outcome):
+    _outcomes[outcome].inc()
+
+
+def stats():
+    return {outcome: c.value for outcome, c in _outcomes.items()}
+
+
+# Raised when the parser is saturated and the wait for a turn timed out or
+# the wait queue was full
+class Overloaded(Exception):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now, cost=1):
+        self.refill(now)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return True
+        return False
+
+
+# One token bucket per key (a username, or a client address)
+class RateLimiter:
+    def __init__(self, rate=USER_RATE, burst=USER_BURST, max_users=MAX_TRACKED_USERS):
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def allow(self, username, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(username)
+            if bucket is None:
+                if len(self._buckets) >= self.max_users:
+                    self._drop_idle(now)
+                bucket = self._buckets[username] = TokenBucket(self.rate, self.burst)
+            return bucket.take(now, cost)
+
+    # A full bucket behaves exactly like a new one, so it can be forgotten
+    def _drop_idle(self, now):
+        for username, bucket in list(self._buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.burst:
+                del self._buckets[username]
+
+
+# Caps how much NLP work runs at once. Callers past the cap wait in a
+# bounded queue; when it is full, or the wait times out, they are turned
+# away instead of piling up behind a slow parse.
+class ConcurrencyGate:
+    def __init__(self, limit=NLP_CONCURRENCY, queue_size=NLP_QUEUE_SIZE, timeout=NLP_WAIT):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def enter(self):
+        with self._cond:
+            if self.active < self.limit:
+                self.active += 1
+                return True
+            if self.waiting >= self.queue_size:
+                return False
+            self.waiting += 1
+            try:
+                admitted = self._cond.wait_for(lambda: self.active < self.limit, self.timeout)
+                if admitted:
+                    self.active += 1
+                return admitted
+            finally:
+                self.waiting -= 1
+
+    def leave(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def __enter__(self):
+        if not self.enter():
+            raise Overloaded()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.leave()
+
+
+rate_limiter = RateLimiter()
+client_limiter = RateLimiter(CLIENT_RATE, CLIENT_BURST)
+nlp_gate = ConcurrencyGate()
+
+
+# Cut a message down to the length the engine is willing to look at
+def limit_length(text):
+    if len(text) > MAX_INPUT_LENGTH:
+        count('truncated')
+        return text[:MAX_INPUT_LENGTH]
+    return text
+
+
+def allow(username):
+    if rate_limiter.allow(username):
+        return True
+    count('rate_limited')
+    return False
+
+
+# Rate limit for an API caller by address, whether or not it names a user
+def allow_client(address, messages=1):
+    if client_limiter.allow(address, messages):
+        return True
+    count('rate_limited')
+    return False
+
+
+def _collect_metrics():
+    yield ('healthbot_nlp_active', 'Parses running right now.', {}, nlp_gate.active)
+    yield ('healthbot_nlp_waiting', 'Requests waiting for a parser slot.', {}, nlp_gate.waiting)
+
+
+metrics.register_collector(_collect_metrics)
@@ -0,0 +1,232 @@
+import argparse
+import atexit
+import glob
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+
+import metrics
+import user_store
+
+# Set HEALTHBOT_ANALYTICS=0 to turn the query log off
+ENABLED = os.environ.get('HEALTHBOT_ANALYTICS', '1') != '0'
+LOG_DIR = os.environ.get('HEALTHBOT_ANALYTICS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'analytics'))
+# Key for the user hash, so log files can't be matched against a list of
+# usernames. When unset a random one is generated and kept in users.db,
+# away from the log files, and shared by every process using that file.
+SALT = os.environ.get('HEALTHBOT_ANALYTICS_SALT')
+
+# Records waiting to be written; when full, new records are dropped
+QUEUE_SIZE = 10000
+# Records written per batch, and the longest a record waits for its batch
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 1.0
+# A log file is closed and a new one started past this many (compressed) bytes
+MAX_FILE_BYTES = 8 * 1024 * 1024
+
+# Stages that mean the bot didn't really understand the message
+MISS_STAGES = ('fallback', 'degraded', 'busy')
+
+_written = metrics.counter('healthbot_analytics_written_total', 'Query log records written.')
+_dropped = metrics.counter('healthbot_analytics_dropped_total', 'Query log records dropped because the queue was full.')
+
+
+_salt = None
+_salt_lock = threading.Lock()
+
+
+def _stored_salt(path=user_store.DB_PATH):
+    with user_store.get_pool(path).connection() as conn:
+        with conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS analytics_salt (id INTEGER PRIMARY KEY CHECK (id = 0), salt BLOB NOT NULL)')
+            conn.execute('INSERT OR IGNORE INTO analytics_salt (id, salt) VALUES (0, ?)', (secrets.token_bytes(32),))
+        return conn.execute('SELECT salt FROM analytics_salt').fetchone()[0]
+
+
+def get_salt():
+    global _salt
+    if _salt is None:
+        with _salt_lock:
+            if _salt is None:
+                _salt = SALT.encode() if SALT else _stored_salt()
+    return _salt
+
+
+def user_hash(username):
+    if not username:
+        return None
+    return hmac.new(get_salt(), username.encode(), hashlib.sha256).hexdigest()[:16]
+
+
+# Appends batches of records to gzip-compressed JSONL files in log_dir.
+# Each batch is its own gzip member, so a file is readable even while it
+# is still being written. Files are named after the time they were started
+# and the process id, so several processes can share the directory.
+class LogWriter(threading.Thread):
+    def __init__(self, records, log_dir=LOG_DIR, max_bytes=MAX_FILE_BYTES):
+        super().__init__(name='analytics-writer', daemon=True)
+        self.records = records
+        self.log_dir = log_dir
+        self.max_bytes = max_bytes
+        self.path = None
+        self._stopped = threading.Event()
+
+    def new_file(self):
+        os.makedirs(self.log_dir, exist_ok=True)
+        self.path = os.path.join(self.log_dir, f'queries-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}.jsonl.gz')
+
+    def write(self, batch):
+        if self.path is None or (os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes):
+            self.new_file()
+        data = ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in batch)
+        with gzip.open(self.path, 'ab') as f:
+            f.write(data.encode('utf-8'))
+        _written.inc(len(batch))
+
+    # Wait for the first record, then take whatever else is queued
+    def next_batch(self):
+        try:
+            batch = [self.records.get(timeout=FLUSH_INTERVAL)]
+        except queue.Empty:
+            return []
+        while len(batch) < BATCH_SIZE:
+            try:
+                batch.append(self.records.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while not self._stopped.is_set():
+            batch = self.next_batch()
+            if batch:
+                self.write(batch)
+
+    # Stop and write out anything still queued
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        batch = []
+        while True:
+            try:
+                batch.append(self.records.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self.write(batch)
+
+
+_records = queue.Queue(QUEUE_SIZE)
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _start_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = LogWriter(_records)
+            _writer.start()
+            atexit.register(_writer.stop)
+
+
+# Queue one record for the log. Never blocks: if the writer has fallen
+# behind and the queue is full, the record is dropped and counted.
+def record(username, stage, condition, seconds, cached=False, query=None):
+    if not ENABLED:
+        return
+    if _writer is None:
+        _start_writer()
+    entry = {'ts': round(time.time(), 3), 'user': user_hash(username), 'stage': stage, 'condition': condition,
+             'ms': round(seconds * 1000, 3), 'cached': cached}
+    if query is not None:
+        entry['query'] = query
+    try:
+        _records.put_nowait(entry)
+    except queue.Full:
+        _dropped.inc()
+
+
+def _collect_metrics():
+    yield ('healthbot_analytics_queued', 'Query log records waiting to be written.', {}, _records.qsize())
+
+
+metrics.register_collector(_collect_metrics)
+
+
+def read_records(log_dir=LOG_DIR):
+    for path in sorted(glob.glob(os.path.join(log_dir, 'queries-*.jsonl.gz'))):
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    yield json.loads(line)
+        except (EOFError, gzip.BadGzipFile):
+            # The last batch of a file another process is still writing
+            continue
+
+
+# Top misses, most asked conditions and latency per stage
+def aggregate(records, top=20, since=None):
+    misses = {}
+    conditions = {}
+    latencies = {}
+    total = 0
+    for entry in records:
+        if since is not None and entry['ts'] < since:
+            continue
+        total += 1
+        if entry['stage'] in MISS_STAGES and entry.get('query'):
+            misses[entry['query']] = misses.get(entry['query'], 0) + 1
+        if entry.get('condition'):
+            conditions[entry['condition']] = conditions.get(entry['condition'], 0) + 1
+        stage = 'cached' if entry.get('cached') else entry['stage']
+        latencies.setdefault(stage, []).append(entry['ms'])
+
+    by_stage = {}
+    for stage, values in latencies.items():
+        values.sort()
+        by_stage[stage] = {'count': len(values), 'p50_ms': metrics.percentile(values, 50),
+                           'p95_ms': metrics.percentile(values, 95), 'p99_ms': metrics.percentile(values, 99)}
+    return {
+        'records': total,
+        'top_misses': sorted(misses.items(), key=lambda item: item[1], reverse=True)[:top],
+        'top_conditions': sorted(conditions.items(), key=lambda item: item[1], reverse=True)[:top],
+        'latency_by_stage': by_stage,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarise the HealthBot query log.")
+    parser.add_argument('--dir', default=LOG_DIR, help="directory holding the queries-*.jsonl.gz files")
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--hours', type=float, help="only look at the last N hours")
+    parser.add_argument('--json', action='store_true', help="print the summary as JSON")
+    args = parser.parse_args(argv)
+
+    since = time.time() - args.hours * 3600 if args.hours else None
+    summary = aggregate(read_records(args.dir), args.top, since)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+
+    print(f"{summary['records']} queries")
+    print("Top misses")
+    for query, count in summary['top_misses']:
+        print(f"  {count:>6}  {query}")
+    print("Most asked conditions")
+    for condition, count in summary['top_conditions']:
+        print(f"  {count:>6}  {condition}")
+    print("Latency by stage (ms)")
+    for stage, stats in sorted(summary['latency_by_stage'].items()):
+        print(f"  {stage:<14}n={stats['count']:<8}p50={stats['p50_ms']:8.2f}  p95={stats['p95_ms']:8.2f}  "
+              f"p99={stats['p99_ms']:8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,68 +1,53 @@
 import streamlit as st
-import spacy
-from spacy.matcher import Matcher
-from spacy.lang.en import STOP_WORDS
-import random
-import sqlite3
-import time
-from hashlib import sha256
-from PIL import Image
-import io
-import base64
 import os
+import threading
+import assets
+import metrics
+from user_store import init_db, check_user, register_user, add_message, recent_messages
+from session_store import get_session_store
+from admission import MAX_INPUT_LENGTH
+
+# Chat messages kept in the session and shown per page of history
+HISTORY_PAGE_SIZE = 20
+
+# Usernames allowed to see the Metrics page, comma separated
+ADMIN_USERS = {name.strip() for name in os.environ.get('HEALTHBOT_ADMINS', '').split(',') if name.strip()}
+
+# When to load the NLP engine: "background" starts loading it as soon as
+# the app starts, "lazy" waits for the first chat message. Either way the
+# login and registration pages render without importing spaCy.
+STARTUP_MODE = os.environ.get('HEALTHBOT_STARTUP', 'background')
+
+# Load the response engine (knowledge base, spaCy model and the watcher
+# that picks up edits to knowledge.json). The work happens once per
+# process, later calls just return the module.
+def load_engine():
+    import responder
+    responder.get_state()
+    responder.watch_knowledge()
+    responder.warm_up()
+    return responder
 
-# Load spaCy model for NLP
 @st.cache_resource
-def load_nlp_model():
-    return spacy.load('en_core_web_sm')
-
-nlp = load_nlp_model()
-
-# Initialize SQLite database
-def init_db():
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS users (
-                    username TEXT PRIMARY KEY,
-                    password TEXT NOT NULL
-                )''')
-    conn.commit()
-    conn.close()
-
-# Hash password
-def hash_password(password):
-    return sha256(password.encode()).hexdigest()
-
-# Check user credentials
-def check_user(username, password):
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
-    c.execute('SELECT password FROM users WHERE username = ?', (username,))
-    stored_password = c.fetchone()
-    conn.close()
-    return stored_password and stored_password[0] == hash_password(password)
-
-# Register a new user
-def register_user(username, password):
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
-    try:
-        c.execute('INSERT INTO users (username, password) VALUES (?, ?)', (username, hash_password(password)))
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False
-    finally:
-        conn.close()
-
-# Custom background for the Streamlit app
-def set_background(image_url):
+def start_engine_in_background():
+    thread = threading.Thread(target=load_engine, name='engine-warm-up', daemon=True)
+    thread.start()
+    return thread
+
+if STARTUP_MODE == 'background':
+    start_engine_in_background()
+
+# Login page background, drawn by the browser so there is nothing to download
+LOGIN_BACKGROUND = 'linear-gradient(135deg, #e0f7fa, #e8f5e9, #fff8e1, #e3f2fd)'
+
+# Custom background for the Streamlit app (any CSS background-image value)
+def set_background(background):
     st.markdown(
         f"""
         <style>
         .stApp {{
-            background-image: url("{image_url}");
-            background-size: cover;
+            background-image: {background};
+            background-size: 400% 400%;
             background-position: center;
             animation: slide 10s infinite alternate;
         }}
@@ -75,400 +60,75 @@ def set_background(image_url):
         unsafe_allow_html=True
     )
 
-# Basic conversation responses
-greetings = {
-    'hi': 'Hello! How can I assist you today?',
-    'hello': 'Hi there! How can I help you?',
-    'how are you': "I'm functioning well, thank you! How can I assist you with your health questions?",
-    'bye': "Take care! Remember, I'm here if you need any health information.",
-    'thanks': "You're welcome! Is there anything else I can help you with?"
-}
-
-# Expanded health advice with additional conditions
-health_advice = {
-    'fever': {
-        'symptoms': 'Elevated body temperature, chills, sweating, dehydration, weakness.',
-        'causes': 'Viral or bacterial infections, heat exhaustion, certain medications.',
-        'treatment': 'Rest, stay hydrated, take over-the-counter fever reducers like acetaminophen or ibuprofen. Seek medical attention if fever is high or persistent.',
-        'prevention': 'Practice good hygiene, stay up to date on vaccinations, maintain a healthy lifestyle.',
-    },
-    'headache': {
-        'symptoms': 'Pain in the head or face, sensitivity to light or sound, nausea.',
-        'causes': 'Stress, dehydration, lack of sleep, eye strain, sinus congestion, or more serious conditions.',
-        'treatment': 'Over-the-counter pain relievers, rest in a dark quiet room, stay hydrated, apply cold or warm compress.',
-        'prevention': 'Manage stress, maintain regular sleep schedule, stay hydrated, limit screen time.',
-    },
-    
-    'common cold': {
-        'symptoms': 'Runny or stuffy nose, sore throat, cough, mild fever, fatigue.',
-        'causes': 'Viral infection, most commonly rhinoviruses.',
-        'treatment': 'Rest, stay hydrated, over-the-counter decongestants and pain relievers, throat lozenges, nasal sprays.',
-        'prevention': 'Wash hands frequently, avoid close contact with infected individuals, boost immune system.'
-    },
-    'flu': {
-        'symptoms': 'Sudden onset of fever, aches, fatigue, cough, sore throat, runny nose.',
-        'causes': 'Influenza viruses.',
-        'treatment': 'Rest, stay hydrated, antiviral medications if caught early, over-the-counter pain relievers and decongestants.',
-        'prevention': 'Annual flu vaccination, good hygiene practices, boosting immune system.'
-    },
-    'allergies': {
-        'symptoms': 'Sneezing, runny nose, itchy eyes, skin rashes.',
-        'causes': 'Reaction to allergens like pollen, dust, pet dander, certain foods.',
-        'treatment': 'Antihistamines, nasal corticosteroids, decongestants.',
-        'prevention': 'Identify and avoid triggers, keep living spaces clean, use air purifiers.'
-    },
-    'stomach ache': {
-        'symptoms': 'Pain or discomfort in the stomach, nausea, bloating.',
-        'causes': 'Indigestion, overeating, gastritis, food poisoning.',
-        'treatment': 'Over-the-counter antacids, rest, avoid heavy foods, stay hydrated.',
-        'prevention': 'Eat slowly, avoid trigger foods, manage stress.'
-    },
-    'sore throat': {
-        'symptoms': 'Pain or irritation in the throat, difficulty swallowing.',
-        'causes': 'Viral infections, bacterial infections, allergies, dry air.',
-        'treatment': 'Gargle with salt water, throat lozenges, over-the-counter pain relievers.',
-        'prevention': 'Practice good hygiene, avoid smoking, stay hydrated.'
-    },
-    'cough': {
-        'symptoms': 'Forceful expulsion of air from the lungs, can be dry or productive.',
-        'causes': 'Infections, allergies, asthma, acid reflux.',
-        'treatment': 'Over-the-counter cough medicines, honey, stay hydrated.',
-        'prevention': 'Avoid irritants, quit smoking, treat underlying conditions.'
-    },
-    'rash': {
-        'symptoms': 'Skin irritation, redness, itching, bumps.',
-        'causes': 'Allergic reactions, infections, heat, stress.',
-        'treatment': 'Anti-itch creams, cool compresses, antihistamines.',
-        'prevention': 'Identify and avoid triggers, use gentle skincare products.'
-    },
-    'earache': {
-        'symptoms': 'Pain in the ear, reduced hearing, fever.',
-        'causes': 'Ear infections, wax buildup, sinus infections.',
-        'treatment': 'Over-the-counter pain relievers, warm compress, see a doctor if severe.',
-        'prevention': 'Avoid inserting objects in ears, treat allergies and colds promptly.'
-    },
-    'toothache': {
-        'symptoms': 'Pain in or around a tooth, sensitivity to hot or cold.',
-        'causes': 'Cavities, gum disease, cracked tooth, infection.',
-        'treatment': 'Over-the-counter pain relievers, cold compress, see a dentist.',
-        'prevention': 'Regular dental hygiene, avoid sugary foods, regular dental check-ups.'
-    },
-    'backache': {
-        'symptoms': 'Pain in the back, stiffness, limited range of motion.',
-        'causes': 'Poor posture, lifting heavy objects, sedentary lifestyle.',
-        'treatment': 'Rest, gentle stretches, over-the-counter pain relievers, heat or cold therapy.',
-        'prevention': 'Maintain good posture, exercise regularly, use proper lifting techniques.'
-    },
-    'nausea': {
-        'symptoms': 'Feeling of sickness with an inclination to vomit, stomach discomfort.',
-        'causes': 'Food poisoning, motion sickness, pregnancy, medications.',
-        'treatment': 'Rest, stay hydrated, eat bland foods, ginger tea, anti-nausea medications.',
-        'prevention': 'Eat slowly, avoid trigger foods, practice good food hygiene.'
-    },
-    'diarrhea': {
-        'symptoms': 'Loose, watery stools, abdominal cramps, urgency to use the bathroom.',
-        'causes': 'Viral or bacterial infections, food intolerances, medications.',
-        'treatment': 'Stay hydrated, eat bland foods, probiotics, over-the-counter anti-diarrheal medications.',
-        'prevention': 'Practice good hygiene, avoid contaminated food and water.'
-    },
-    'constipation': {
-        'symptoms': 'Infrequent bowel movements, difficulty passing stools, abdominal discomfort.',
-        'causes': 'Low fiber diet, dehydration, lack of physical activity, certain medications.',
-        'treatment': 'Increase fiber intake, stay hydrated, exercise, over-the-counter laxatives if needed.',
-        'prevention': 'Eat a high-fiber diet, stay hydrated, regular exercise.'
-    },
-    'indigestion': {
-        'symptoms': 'Discomfort in upper abdomen, feeling of fullness, burning sensation.',
-        'causes': 'Overeating, eating too quickly, fatty or spicy foods, stress.',
-        'treatment': 'Over-the-counter antacids, avoid trigger foods, eat slowly.',
-        'prevention': 'Eat smaller meals, avoid trigger foods, manage stress.'
-    },
-    'sunburn': {
-        'symptoms': 'Red, painful skin that feels hot to the touch, possible blistering.',
-        'causes': 'Overexposure to UV radiation from the sun.',
-        'treatment': 'Cool compresses, aloe vera gel, moisturizer, over-the-counter pain relievers.',
-        'prevention': 'Use sunscreen, wear protective clothing, limit sun exposure during peak hours.'
-    },
-    'insomnia': {
-        'symptoms': 'Difficulty falling asleep or staying asleep, daytime fatigue.',
-        'causes': 'Stress, anxiety, caffeine, irregular sleep schedule.',
-        'treatment': 'Improve sleep hygiene, relaxation techniques, cognitive behavioral therapy.',
-        'prevention': 'Regular sleep schedule, avoid screens before bedtime, manage stress.'
-    },
-    'sprain': {
-        'symptoms': 'Pain, swelling, bruising, limited mobility in the affected joint.',
-        'causes': 'Sudden twisting or force on a joint.',
-        'treatment': 'RICE (Rest, Ice, Compression, Elevation), over-the-counter pain relievers.',
-        'prevention': 'Proper warm-up before exercise, wear supportive shoes, strengthen muscles.'
-    },
-    'acne': {
-        'symptoms': 'Pimples, blackheads, whiteheads, oily skin.',
-        'causes': 'Hormonal changes, excess oil production, bacteria, clogged pores.',
-        'treatment': 'Over-the-counter acne products, proper skincare routine, prescription medications if severe.',
-        'prevention': 'Regular face washing, non-comedogenic products, healthy diet.'
-    },
-    'motion sickness': {
-        'symptoms': 'Nausea, dizziness, cold sweats, vomiting.',
-        'causes': 'Conflicting sensory signals to the brain during movement.',
-        'treatment': 'Over-the-counter motion sickness medications, focus on a stable object, get fresh air.',
-        'prevention': 'Sit in areas with less motion, look at the horizon, avoid reading while in motion.'
-    },
-    'eye strain': {
-        'symptoms': 'Sore or irritated eyes, difficulty focusing, headaches.',
-        'causes': 'Prolonged screen time, reading without proper lighting, need for vision correction.',
-        'treatment': 'Rest eyes, adjust lighting, use artificial tears.',
-        'prevention': '20-20-20 rule (every 20 minutes, look at something 20 feet away for 20 seconds), proper lighting.'
-    },
-    'dehydration': {
-        'symptoms': 'Thirst, dry mouth, dark urine, fatigue, dizziness.',
-        'causes': 'Not drinking enough water, excessive sweating, diarrhea, vomiting.',
-        'treatment': 'Drink water or electrolyte solutions, rest, seek medical attention if severe.',
-        'prevention': 'Drink adequate water throughout the day, increase intake during hot weather or exercise.'
-    },
-    'heartburn': {
-        'symptoms': 'Burning sensation in the chest or throat, bitter taste in mouth.',
-        'causes': 'Acid reflux, certain foods, obesity, pregnancy.',
-        'treatment': 'Over-the-counter antacids, avoid trigger foods, eat smaller meals.',
-        'prevention': 'Maintain healthy weight, avoid lying down after meals, limit acidic and spicy foods.'
-    },
-    'muscle strain': {
-        'symptoms': 'Pain, swelling, limited range of motion in affected muscle.',
-        'causes': 'Overexertion, improper lifting, sudden movements.',
-        'treatment': 'Rest, ice, compression, elevation, over-the-counter pain relievers.',
-        'prevention': 'Proper warm-up before exercise, use correct form when lifting, gradual increase in activity.'
-    },
-    'nose bleed': {
-        'symptoms': 'Blood flowing from one or both nostrils.',
-        'causes': 'Dry air, nose picking, injury, blood thinners.',
-        'treatment': 'Pinch nostrils, lean forward, apply cold compress to nose.',
-        'prevention': 'Use a humidifier, avoid nose picking, use saline nasal spray to keep nasal passages moist.'
-    },
-    'anxiety': {
-        'symptoms': 'Excessive worry, restlessness, difficulty concentrating, sleep problems.',
-        'causes': 'Stress, traumatic experiences, genetic factors, brain chemistry.',
-        'treatment': 'Therapy, relaxation techniques, medications in severe cases.',
-        'prevention': 'Regular exercise, adequate sleep, stress management techniques, limit caffeine and alcohol.'
-    },
-    'burns': {
-        'symptoms': 'Skin redness, pain, swelling, blistering (depending on severity).',
-        'causes': 'Contact with heat, chemicals, electricity, or radiation.',
-        'treatment': 'Cool the burn with running water, apply aloe vera, cover with sterile gauze.',
-        'prevention': 'Use caution around hot objects, wear protective gear when handling chemicals.'
-    },
-    'food poisoning': {
-        'symptoms': 'Nausea, vomiting, diarrhea, abdominal pain, fever.',
-        'causes': 'Consuming contaminated food or drink.',
-        'treatment': 'Rest, stay hydrated, eat bland foods when able, seek medical attention if severe.',
-        'prevention': 'Practice good food hygiene, cook foods thoroughly, avoid risky foods.'
-    },
-    'migraine': {
-        'symptoms': 'Severe headache, often one-sided, sensitivity to light and sound, nausea.',
-        'causes': 'Hormonal changes, certain foods, stress, environmental factors.',
-        'treatment': 'Rest in dark quiet room, over-the-counter pain relievers, prescription medications.',
-        'prevention': 'Identify and avoid triggers, maintain regular sleep and meal schedules, manage stress.'
-    },
-    'pink eye': {
-        'symptoms': 'Redness, itching, and discharge in one or both eyes.',
-        'causes': 'Viral or bacterial infection, allergies.',
-        'treatment': 'Artificial tears, warm compresses, antibiotic eye drops if bacterial.',
-        'prevention': 'Practice good hygiene, avoid touching or rubbing eyes, do not share personal items.'
-    },
-    'urinary tract infection': {
-        'symptoms': 'Frequent urination, burning sensation when urinating, cloudy urine.',
-        'causes': 'Bacteria entering the urinary tract.',
-        'treatment': 'Antibiotics, drink plenty of water, urinate frequently.',
-        'prevention': 'Stay hydrated, urinate after sexual activity, wipe from front to back.'
-    }
-}
-symptom_weights = {
-    "fever": 2,
-    "cough": 2,
-    "sore throat": 1.5,
-    "headache": 2,
-    "fatigue": 1.5,
-    "nasal congestion": 1.5,
-    "runny nose": 1.5,
-    "sneezing": 1.5,
-    "itchy eyes": 1.5,
-    "skin rash": 1.5,
-    "stomach ache": 2,
-    "nausea": 2,
-    "vomiting": 2,
-    "diarrhea": 2,
-    "constipation": 1.5,
-    "indigestion": 1.5,
-    "sunburn": 2,
-    "insomnia": 1.5,
-    "sprain": 2,
-    "acne": 1.5,
-    "motion sickness": 1.5,
-    "eye strain": 1.5,
-    "dehydration": 2,
-    "heartburn": 1.5,
-    "muscle strain": 2,
-    "nosebleed": 1.5,
-    "anxiety": 2,
-    "burns": 2,
-    "food poisoning": 2,
-    "migraine": 2,
-    "pink eye": 1.5,
-    "urinary tract infection": 2,
-    "back pain": 2,
-    "chest pain": 2,
-    "shortness of breath": 2,
-    "swelling": 1.5,
-    "bruising": 1.5,
-    "weakness": 1.5,
-    "numbness": 1.5,
-    "tingling": 1.5,
-    "loss of appetite": 1.5,
-    "weight loss": 1.5,
-    "weight gain": 1.5,
-    "changes in vision": 1.5,
-    "changes in hearing": 1.5,
-    "difficulty swallowing": 1.5,
-    "difficulty urinating": 1.5,
-    "changes in bowel habits": 1.5,
-    "skin changes": 1.5,
-    "hair loss": 1.5,
-    "nail changes": 1.5,
-    "frequent urination": 1.5,
-    "night sweats": 1.5,
-    "cold sweats": 1.5,
-    "chills": 1.5,
-    "fever": 2,
-    "fatigue": 1.5,
-    "joint pain": 2,
-    "stiffness": 1.5,
-    "swelling": 1.5,
-    "redness": 1.5,
-    "itching": 1.5,
-    "pain": 2,
-    "discomfort": 2,
-    "tenderness": 1.5
-}
-def get_response(user_input):
-    if "hello" in user_input:
-        if "logged_in" in st.session_state and st.session_state.logged_in:
-            return "Welcome back!"
-        else:
-            return "Hello! How can I assist you today?"
-    elif "bye" in user_input:
-        return "Goodbye!"
-
-    user_input = user_input.lower()
-
-    # Check for basic conversational responses
-    for key in greetings:
-        if key in user_input:
-            return greetings[key]
-
-    # Check for detailed health advice
-    for condition, info in health_advice.items():
-        if condition in user_input:
-            response = f"Here's what I know about {condition}:\n\n"
-            for key, value in info.items():
-                response += f"{key.capitalize()}: {value}\n\n"
-            return response
-
-    # Extract symptoms from user input using NLP
-    extracted_symptoms = extract_symptoms(user_input)
-
-    # Calculate a likelihood score for each condition based on symptom weights
-    condition_scores = {}
-    for condition, info in health_advice.items():
-        condition_score = 0
-        for symptom in extracted_symptoms:
-            if symptom in info['symptoms']:
-                condition_score += symptom_weights[symptom]
-        condition_scores[condition] = condition_score
-
-    # Find the condition with the highest score
-    most_likely_condition = max(condition_scores, key=condition_scores.get)
-    # Identify conditions with scores above a threshold
-    threshold = 2  # Adjust threshold as needed
-    possible_conditions = [condition for condition, score in condition_scores.items() if score >= threshold]
-
-    if len(possible_conditions) > 1:
-        response = "Based on your symptoms, you might have:\n"
-        for condition in possible_conditions:
-            response += f"- {condition}\n"
-        response += "\nIt's important to consult a healthcare professional for a proper diagnosis and treatment plan."
-    else:
-
-    # Return the most likely condition and its information
-        return f"Based on your symptoms, the most likely condition is: {most_likely_condition}\n\n{health_advice[most_likely_condition]}"
-
-def extract_symptoms(user_input):
-    nlp = spacy.load("en_core_web_sm")
-    matcher = Matcher(nlp.vocab)
-
-    # Define patterns for common symptom expressions
-    patterns = [
-        [{"POS": "ADJ", "DEP": "amod"}, {"POS": "NOUN"}],  # Example: "high fever"
-        [{"POS": "VERB", "DEP": "ROOT"}, {"POS": "NOUN"}],  # Example: "have a headache"
-        [{"POS": "NOUN"}, {"POS": "ADJ"}],  # Example: "painful throat"
-        [{"POS": "VERB"}, {"POS": "ADJ"}],  # Example: "feel dizzy"
-    ]
-    matcher.add("SYMPTOM", patterns)
-
-    doc = nlp(user_input)
-    matches = matcher(doc)
-
-    extracted_symptoms = []
-    for match_id, start, end in matches:
-        span = doc[start:end]
-        extracted_symptoms.append(span.text)
-    # Remove stop words and duplicates
-    extracted_symptoms = [entity for entity in extracted_symptoms if entity not in STOP_WORDS]
-    extracted_symptoms = list(set(extracted_symptoms))
-
-    return extracted_symptoms
-
-    # If no match found, provide a general response
-    general_responses = [
-        "I'm not sure about that specific condition. Could you provide more details or symptoms?",
-        "I don't have information on that particular issue. Is there a related health topic you'd like to know about?",
-        "I'm afraid I don't have specific advice for that. Remember, it's always best to consult a healthcare professional for personalized medical advice.",
-        "I don't have data on that. Can you rephrase your question or ask about a different health topic?"
-    ]
-    return random.choice(general_responses)
+# The answer a paragraph at a time for st.write_stream, which types it
+# out; the answer itself is ready before the first paragraph shows.
+# Symptoms from earlier messages in the session count too.
+def stream_response(user_input):
+    return load_engine().stream_response(user_input, logged_in=st.session_state.get('logged_in', False),
+                                         username=st.session_state.get('username'),
+                                         context=symptom_context())
+
+# Symptoms mentioned so far, picked up from the shared session store when
+# this process hasn't seen the session before
+def symptom_context():
+    if 'symptom_context' not in st.session_state:
+        from scoring import SymptomContext
+        session = get_session_store().get(st.session_state.get('session_token'))
+        st.session_state.symptom_context = SymptomContext.from_dict(session['data'].get('symptoms', {}) if session else {})
+    return st.session_state.symptom_context
 
 # Streamlit app
 st.title("Health Chatbot with Authentication")
 
-# Initialize database and session state
+# Initialize database (once per process) and session state
 init_db()
 
 # Authentication Section
 if 'logged_in' not in st.session_state:
     st.session_state.logged_in = False
 
+# Logins live in the shared session store and the browser keeps the token
+# in the URL, so whichever app process serves the next request (after a
+# reconnect or behind a load balancer) can pick the login back up. A token
+# that has expired or was logged out elsewhere ends the login here too.
+# Anyone with the URL holds the login, so sessions also end a fixed time
+# after they were created (HEALTHBOT_SESSION_MAX_AGE) however active.
+sessions = get_session_store()
+token = st.query_params.get("session")
+if token:
+    session = sessions.get(token)
+    if session:
+        st.session_state.logged_in = True
+        st.session_state.username = session["username"]
+        st.session_state.session_token = token
+    else:
+        del st.query_params["session"]
+        if st.session_state.get("session_token") == token:
+            st.session_state.logged_in = False
+            st.session_state.pop("session_token", None)
+
 if not st.session_state.logged_in:
     # Set a default background for login and registration
-    set_background('https://media.giphy.com/media/3o7TKz2eMXx7dn95FS/giphy.gif?cid=ecf05e47480rkr9agsiw1mtgfndovyg2roi2a73efbha4ji1&ep=v1_gifs_related&rid=giphy.gif&ct=g')  # Example image URL
-
-    # Check if the image file exists
-    image_path = 'C:/Users/Dev Vyas/Downloads/1726302958547.png'
-    if os.path.exists(image_path):
-        # Create a sidebar with a centered image
-        st.sidebar.markdown(
-            f"""
-            <style>
-            .sidebar-image {{
-                display: flex;
-                justify-content: center;
-                margin-bottom: 20px;
-            }}
-            </style>
-            <div class="sidebar-image">
-                <img src="data:image/png;base64,{base64.b64encode(open(image_path, "rb").read()).decode()}" width="150" />
-            </div>
-            """,
-            unsafe_allow_html=True
-        )
-    else:
-        st.sidebar.error("Image file not found.")
+    set_background(LOGIN_BACKGROUND)
+
+    # Create a sidebar with a centered logo. It is resized and compressed
+    # once per process and served as a static file, so the page only
+    # carries its URL.
+    st.sidebar.markdown(
+        f"""
+        <style>
+        .sidebar-image {{
+            display: flex;
+            justify-content: center;
+            margin-bottom: 20px;
+        }}
+        </style>
+        <div class="sidebar-image">
+            <img src="{assets.url('logo')}" width="150" />
+        </div>
+        """,
+        unsafe_allow_html=True
+    )
 
     # Choose between login and registration
     st.sidebar.title("Login / Register")
@@ -495,6 +155,9 @@ if not st.session_state.logged_in:
         if login_button:
             if check_user(username, password):
                 st.session_state.logged_in = True
+                st.session_state.username = username
+                st.session_state.session_token = sessions.create(username)
+                st.query_params["session"] = st.session_state.session_token
                # st.experimental_rerun()
             else:
                 st.error("Invalid username or password.")
@@ -503,34 +166,60 @@ else:
     # Main Chatbot Interface
     # Set background for chatbot (Only if needed)
     # if 'background' not in st.session_state:
-    #    st.session_state.background = 'https://media.giphy.com/media/3o7TKz2eMXx7dn95FS/giphy.gif?cid=ecf05e47480rkr9agsiw1mtgfndovyg2roi2a73efbha4ji1&ep=v1_gifs_related&rid=giphy.gif&ct=g'  # Default background
+    #    st.session_state.background = LOGIN_BACKGROUND  # Default background
 
     # set_background(st.session_state.background)
 
-    # Initialize chat history
+    # Initialize chat history with the most recent page from the database
+    username = st.session_state.get("username", "")
     if "messages" not in st.session_state:
-        st.session_state.messages = []
+        st.session_state.messages = recent_messages(username, HISTORY_PAGE_SIZE)
+        st.session_state.history_limit = HISTORY_PAGE_SIZE
+        st.session_state.history_exhausted = len(st.session_state.messages) < HISTORY_PAGE_SIZE
+
+    # Load older history a page at a time
+    if not st.session_state.history_exhausted and st.button("Load older messages"):
+        oldest = st.session_state.messages[0]["id"] if st.session_state.messages else None
+        older = recent_messages(username, HISTORY_PAGE_SIZE, before_id=oldest)
+        st.session_state.messages = older + st.session_state.messages
+        st.session_state.history_limit += HISTORY_PAGE_SIZE
+        st.session_state.history_exhausted = len(older) < HISTORY_PAGE_SIZE
 
     # Display chat messages from history
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
 
+    # Add a message to the history, keeping only the window in memory
+    def remember(role, content):
+        content = content or ""
+        message_id = add_message(username, role, content)
+        if "session_token" in st.session_state:
+            sessions.add_context(st.session_state.session_token, role, content)
+        st.session_state.messages.append({"id": message_id, "role": role, "content": content})
+        overflow = len(st.session_state.messages) - st.session_state.history_limit
+        if overflow > 0:
+            del st.session_state.messages[:overflow]
+            st.session_state.history_exhausted = False
+
     # React to user input
-    if prompt := st.chat_input("What's your health question?"):
+    if prompt := st.chat_input("What's your health question?", max_chars=MAX_INPUT_LENGTH):
         st.chat_message("user").markdown(prompt)
-        st.session_state.messages.append({"role": "user", "content": prompt})
-
-        response = get_response(prompt)
+        remember("user", prompt)
 
         with st.chat_message("assistant"):
-            st.markdown(response)
-        st.session_state.messages.append({"role": "assistant", "content": response})
+            response = st.write_stream(stream_response(prompt))
+        remember("assistant", response)
+        if "session_token" in st.session_state:
+            sessions.update(st.session_state.session_token, symptoms=st.session_state.symptom_context.to_dict())
 
     
     # Advanced HealthBot Section
     st.sidebar.title("Advanced HealthBot")
-    advanced_option = st.sidebar.selectbox("Select an advanced feature", ["None", "Health Tips", "Recent Health Trends", "Symptom Checker", "Fitness Tracker", "Nutrition Advice"])
+    advanced_options = ["None", "Health Tips", "Recent Health Trends", "Symptom Checker", "Fitness Tracker", "Nutrition Advice"]
+    if username in ADMIN_USERS:
+        advanced_options.append("Metrics")
+    advanced_option = st.sidebar.selectbox("Select an advanced feature", advanced_options)
 
     if advanced_option == "Health Tips":
         st.header("Health Tips")
@@ -562,19 +251,32 @@ else:
 
     elif advanced_option == "Symptom Checker":
         st.header("Symptom Checker")
-        st.markdown("Enter your symptoms to get more information. This feature helps you understand possible causes and next steps.")
-        symptoms = st.text_input("Describe your symptoms")
-        if symptoms:
-            st.markdown(f"Analyzing your symptoms: {symptoms}")
-            st.markdown(
-                """
-                Based on your description, here are some potential causes and advice:
-                - *Common Cold*: Symptoms like a runny nose and cough might indicate a common cold. Rest and stay hydrated.
-                - *Flu*: If you have high fever and body aches, it could be the flu. Consider visiting a healthcare provider.
-                - *Allergies*: Symptoms like sneezing and itchy eyes might be due to allergies. Avoid known allergens and consider antihistamines.
-                - *Consult a Doctor*: For persistent or severe symptoms, it's important to consult a healthcare professional for a proper diagnosis.
-                """
-            )
+        st.markdown("Add your symptoms one at a time to see which conditions fit them best. This feature helps you understand possible causes and next steps.")
+        # Only the knowledge base is needed here, not the spaCy model
+        import responder
+        from scoring import SymptomTally
+        state = responder.get_state()
+        selected = st.multiselect("Your symptoms", sorted(state.kb.symptom_weights))
+        described = st.text_input("Or describe your symptoms")
+        if described:
+            selected = set(selected) | set(responder.keyword_symptoms(described.lower(), state))
+
+        # The tally lives in the session and only the added or removed
+        # symptoms are applied on each rerun. It starts over when the
+        # knowledge base is reloaded.
+        tally = st.session_state.get('symptom_tally')
+        if tally is None or tally.engine is not state.scoring_engine:
+            tally = st.session_state.symptom_tally = SymptomTally(state.scoring_engine)
+        tally.update(selected)
+
+        ranked = tally.top(5)
+        if ranked:
+            st.markdown("Based on your symptoms, these conditions match best:")
+            for condition, score in ranked:
+                st.markdown(f"- *{condition.title()}* (score {score:g})")
+            st.markdown("For persistent or severe symptoms, it's important to consult a healthcare professional for a proper diagnosis.")
+        elif selected:
+            st.markdown("None of the conditions I know about match these symptoms. Please consult a healthcare professional if they persist.")
 
     elif advanced_option == "Fitness Tracker":
         st.header("Fitness Tracker")
@@ -600,6 +302,16 @@ else:
             """
         )
 
+    elif advanced_option == "Metrics" and username in ADMIN_USERS:
+        st.header("Metrics")
+        if not metrics.ENABLED:
+            st.info("Metrics are switched off (HEALTHBOT_METRICS=0).")
+        else:
+            st.markdown("Latency per stage since this process started. Percentiles are bucket upper bounds.")
+            st.dataframe(metrics.stage_summary())
+            with st.expander("Prometheus format"):
+                st.code(metrics.render_prometheus(), language="text")
+
 
         # Add a sidebar with some information about the chatbot
     st.sidebar.title("About HealthBot")
@@ -610,4 +322,10 @@ else:
     )
     if st.session_state.logged_in:
         if st.sidebar.button("Logout"):
-            st.session_state.logged_in = False
\ No newline at end of file
+            st.session_state.logged_in = False
+            if "session_token" in st.session_state:
+                sessions.delete(st.session_state.session_token)
+            st.query_params.pop("session", None)
+            for key in ("username", "session_token", "messages", "history_limit", "history_exhausted", "symptom_tally",
+                        "symptom_context"):
+                st.session_state.pop(key, None)
\ No newline at end of file
@@ -0,0 +1,120 @@
+import argparse
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from collections import namedtuple
+
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+# Built files go where Streamlit serves static files from (see
+# .streamlit/config.toml), at app/static/<filename>
+STATIC_DIR = os.path.join(ASSET_DIR, 'static')
+
+# Images the app shows: name -> (source file, largest width or height in
+# pixels). Sizes are twice the displayed size so they stay sharp on
+# high-density screens.
+ASSETS = {
+    'logo': ('logo.png', 300),
+}
+QUALITY = 85
+
+# Built file names change whenever their content does, so clients may keep them forever
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+Asset = namedtuple('Asset', ['name', 'filename', 'content_type', 'data'])
+
+
+# Shrink an image to fit max_size and re-encode it as WebP
+def compress(source, max_size, quality=QUALITY):
+    from PIL import Image
+
+    with Image.open(source) as image:
+        image.thumbnail((max_size, max_size))
+        out = io.BytesIO()
+        image.save(out, 'WEBP', quality=quality, method=6)
+    return out.getvalue()
+
+
+# Write data to path atomically. Each writer gets its own temporary file,
+# so several processes building at once don't trip over each other.
+def _write(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+# Build every asset into static_dir, named after a hash of the source and
+# the settings, so an unchanged asset is only compressed the first time.
+# Older builds of the same asset are removed. Safe to run from several
+# processes at once: files another process removed first are skipped.
+def build(static_dir=STATIC_DIR):
+    os.makedirs(static_dir, exist_ok=True)
+    built = {}
+    for name, (source, max_size) in ASSETS.items():
+        path = os.path.join(ASSET_DIR, source)
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read() + f'{max_size}:{QUALITY}'.encode()).hexdigest()[:12]
+        filename = f'{name}.{digest}.webp'
+        target = os.path.join(static_dir, filename)
+        try:
+            with open(target, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = compress(path, max_size)
+            _write(target, data)
+        for old in os.listdir(static_dir):
+            if old.startswith(f'{name}.') and old != filename and not old.endswith('.tmp'):
+                try:
+                    os.remove(os.path.join(static_dir, old))
+                except FileNotFoundError:
+                    pass
+        built[name] = Asset(name, filename, 'image/webp', data)
+    return built
+
+
+_assets = None
+_assets_lock = threading.Lock()
+
+
+# Built assets by name, built on first use
+def get_assets():
+    global _assets
+    if _assets is None:
+        with _assets_lock:
+            if _assets is None:
+                _assets = build()
+    return _assets
+
+
+# URL of an asset as served by Streamlit
+def url(name):
+    return f'app/static/{get_assets()[name].filename}'
+
+
+# The asset with this built file name, or None
+def find(filename):
+    for asset in get_assets().values():
+        if asset.filename == filename:
+            return asset
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resize and compress the app's images into static/.")
+    parser.parse_args(argv)
+    for name, asset in build().items():
+        source = os.path.join(ASSET_DIR, ASSETS[name][0])
+        print(f"{name}: {os.path.getsize(source)} -> {len(asset.data)} bytes, static/{asset.filename}")
+
+
+if __name__ == '__main__':
+    main()
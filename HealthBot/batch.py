@@ -0,0 +1,59 @@
+import argparse
+import json
+import sys
+import time
+from collections import deque
+
+from responder import get_responses, warm_up
+
+
+# Each input line is either a JSON string or an object with a text field
+def read_messages(path, field):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {field: record}
+            yield record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run exported messages through HealthBot offline.")
+    parser.add_argument('input', help="JSONL file of messages")
+    parser.add_argument('output', help="JSONL file to write responses to")
+    parser.add_argument('--field', default='text', help="field holding the message text (default: text)")
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--n-process', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    # Records are read as get_responses asks for their messages and kept
+    # only until their response comes back, so memory stays at about one
+    # chunk of records however large the export is
+    pending = deque()
+
+    def messages():
+        for record in read_messages(args.input, args.field):
+            pending.append(record)
+            yield record[args.field]
+
+    # Load the model up front so it isn't counted in the throughput
+    warm_up()
+    count = 0
+    start = time.perf_counter()
+    with open(args.output, 'w', encoding='utf-8') as out:
+        for response in get_responses(messages(), args.batch_size, args.n_process):
+            record = pending.popleft()
+            record['response'] = response
+            out.write(json.dumps(record) + '\n')
+            count += 1
+    elapsed = time.perf_counter() - start
+
+    rate = count / elapsed if elapsed else 0.0
+    print(f"{count} messages in {elapsed:.2f}s ({rate:.1f} messages/sec)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import user_store
+
+
+# Logins per second with a number of threads hammering check_user
+def login_throughput(path, usernames, threads, logins):
+    def login(i):
+        username = usernames[i % len(usernames)]
+        return user_store.check_user(username, 'pw-' + username, path=path)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        ok = sum(executor.map(login, range(logins)))
+    elapsed = time.perf_counter() - start
+    assert ok == logins, "some logins failed"
+    return logins / elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark concurrent logins against the user store.")
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--logins', type=int, default=20000)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench_users.db')
+        usernames = [f'user{i}' for i in range(args.users)]
+
+        start = time.perf_counter()
+        added = user_store.bulk_register(((name, 'pw-' + name) for name in usernames), path=path)
+        print(f"bulk import: {added} accounts in {time.perf_counter() - start:.2f}s")
+
+        for threads in args.threads:
+            rate = login_throughput(path, usernames, threads, args.logins)
+            print(f"{threads:>3} threads: {rate:10.0f} logins/sec")
+
+        user_store.get_pool(path).close()
+
+
+if __name__ == '__main__':
+    main()
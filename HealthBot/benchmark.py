@@ -0,0 +1,190 @@
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import analytics
+import responder
+import user_store
+from bench_logins import login_throughput
+from metrics import percentile
+
+SYMPTOM_TEMPLATES = [
+    "I have {a} and {b}",
+    "since yesterday I've had {a}",
+    "my kid has {a}, {b} and {c}",
+    "feeling {a} with some {b}",
+]
+FREE_TEXT = [
+    "I feel dizzy and my head hurts a lot",
+    "my throat is painful when I swallow",
+    "I have a high temperature and feel weak",
+    "there is a burning feeling in my chest after eating",
+    "my skin is red and itchy after the beach",
+]
+MISSES = [
+    "what is the capital of france",
+    "can you recommend a good book",
+    "blood coming out of my nostrils",
+    "qwertyuiop",
+    "is it going to rain tomorrow",
+]
+
+# Metrics where a higher number is better; for everything else lower is better
+HIGHER_IS_BETTER = ('throughput', 'ops_per_sec')
+# Latency changes smaller than this are timer noise, not regressions
+MIN_LATENCY_DELTA_MS = 0.05
+
+
+# Generated query corpus, the same for a given seed and knowledge base
+def build_corpus(kb, size, seed=0):
+    rng = random.Random(seed)
+    symptoms = list(kb.symptom_weights)
+    corpus = {
+        'greeting': [rng.choice(list(kb.greetings)).capitalize() + rng.choice(['', '!', '?']) for _ in range(size)],
+        'condition': [rng.choice(["what is {}", "tell me about {}", "how do I treat {}?"]).format(rng.choice(kb.condition_names))
+                      for _ in range(size)],
+        'symptom': [rng.choice(SYMPTOM_TEMPLATES).format(**dict(zip('abc', rng.sample(symptoms, 3))))
+                    for _ in range(size)],
+        'free_text': [rng.choice(FREE_TEXT) for _ in range(size)],
+        'miss': [rng.choice(MISSES) for _ in range(size)],
+    }
+    return corpus
+
+
+# Latency percentiles (ms) and throughput for calling func on every input
+def measure(func, inputs):
+    latencies = []
+    start = time.perf_counter()
+    for item in inputs:
+        t = time.perf_counter()
+        func(item)
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'count': len(inputs),
+        'p50_ms': 1000 * percentile(latencies, 50),
+        'p95_ms': 1000 * percentile(latencies, 95),
+        'p99_ms': 1000 * percentile(latencies, 99),
+        'throughput': len(inputs) / elapsed if elapsed else 0.0,
+    }
+
+
+def bench_engine(corpus, with_parser):
+    state = responder.get_state()
+    all_queries = [query for queries in corpus.values() for query in queries]
+    symptom_queries = corpus['symptom'] + corpus['free_text']
+    results = {}
+
+    results['keyword_scan'] = measure(lambda q: responder.keyword_response(q, False, state), all_queries)
+    results['symptom_keywords'] = measure(lambda q: responder.keyword_symptoms(q.lower(), state), symptom_queries)
+    extracted = [responder.keyword_symptoms(q.lower(), state) for q in corpus['symptom']]
+    results['scoring'] = measure(lambda s: responder.symptom_response(s, state), extracted)
+    results['fallback_search'] = measure(lambda q: responder.fallback_response(q, state), corpus['miss'])
+
+    if with_parser:
+        engine = responder.get_engine().warm_up()
+        results['parse'] = measure(engine.extract_symptoms, [q.lower() for q in corpus['free_text']])
+        # End to end, without the response cache
+        for kind, queries in corpus.items():
+            results[f'end_to_end_{kind}'] = measure(lambda q: responder._get_response(q, True, state), queries)
+        responder.response_cache.clear()
+        results['end_to_end_cached'] = measure(lambda q: responder.get_response(q, True), all_queries)
+    return results
+
+
+# Registrations and logins per second against a throwaway database
+def bench_user_store(users, thread_counts):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench_users.db')
+        usernames = [f'user{i}' for i in range(users)]
+        for threads in thread_counts:
+            names = [f'{name}-t{threads}' for name in usernames]
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                list(executor.map(lambda name: user_store.register_user(name, 'pw-' + name, path=path), names))
+            elapsed = time.perf_counter() - start
+            results[f'register_{threads}_threads'] = {'ops_per_sec': users / elapsed}
+            results[f'check_user_{threads}_threads'] = {
+                'ops_per_sec': login_throughput(path, names, threads, users * 2)}
+        user_store.get_pool(path).close()
+    return results
+
+
+# Regressions beyond threshold (a fraction) compared with a baseline run
+def compare(results, baseline, threshold):
+    regressions = []
+    for section in ('engine', 'user_store', 'memory'):
+        for name, metrics in results.get(section, {}).items():
+            old_metrics = baseline.get(section, {}).get(name, {})
+            for metric, value in metrics.items():
+                old = old_metrics.get(metric)
+                if metric == 'count' or not old:
+                    continue
+                if metric.endswith('_ms') and abs(value - old) < MIN_LATENCY_DELTA_MS:
+                    continue
+                change = (value - old) / old
+                worse = -change if metric in HIGHER_IS_BETTER else change
+                if worse > threshold:
+                    regressions.append(f"{section}.{name}.{metric}: {old:.3f} -> {value:.3f} ({worse:+.0%} worse)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the HealthBot response engine and user store.")
+    parser.add_argument('--size', type=int, default=500, help="queries per category")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--users', type=int, default=2000, help="accounts per user store run")
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--no-parser', action='store_true', help="skip stages that need the spaCy model")
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--baseline', help="earlier results to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2, help="allowed slowdown before flagging (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    # Benchmark queries are not real traffic, so keep them out of the query log
+    analytics.ENABLED = False
+    corpus = build_corpus(responder.get_state().kb, args.size, args.seed)
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'size': args.size,
+            'seed': args.seed,
+            'knowledge_version': responder.get_state().kb.version,
+        },
+        'engine': bench_engine(corpus, not args.no_parser),
+        'user_store': bench_user_store(args.users, args.threads),
+    }
+    results['memory'] = {'peak': {'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}}
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    for section in ('engine', 'user_store'):
+        for name, metrics in results[section].items():
+            print(f"{section:<11}{name:<30}" + '  '.join(f"{k}={v:.3f}" for k, v in metrics.items() if k != 'count'))
+    print(f"memory     peak RSS {results['memory']['peak']['max_rss_mb']:.1f} MB")
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for line in regressions:
+                print("  " + line)
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+PUNCTUATION_RE = re.compile(r"[^\w\s]+")
+
+_stop_words = None
+
+
+# spaCy's English stop words, imported on first use so that importing
+# this module doesn't pull in spaCy
+def stop_words():
+    global _stop_words
+    if _stop_words is None:
+        from spacy.lang.en import STOP_WORDS
+        _stop_words = STOP_WORDS
+    return _stop_words
+
+
+# Normalized form of a message for grouping similar queries (search
+# terms, the query log): lowercased, punctuation and whitespace collapsed
+# and stop words removed. Messages made up only of stop words ("how are
+# you") keep their words. Too lossy for a response cache key, since the
+# keyword matcher answers "today" and "how are you today" differently.
+def normalize(text):
+    words = PUNCTUATION_RE.sub(' ', text.lower()).split()
+    content = [word for word in words if word not in stop_words()]
+    return ' '.join(content or words)
+
+
+# Thread-safe LRU cache with an optional time-to-live per entry
+class LRUCache:
+    def __init__(self, max_size=1024, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,178 @@
+import math
+from collections import namedtuple
+
+import numpy as np
+
+from cache import stop_words
+from keyword_matcher import tokenize
+
+FuzzyMatch = namedtuple('FuzzyMatch', ['key', 'phrase', 'score', 'start', 'end'])
+
+NGRAM = 3
+THRESHOLD = 0.7
+# Looser threshold for whole phrases that are already known to describe a
+# symptom (spans found by the parser), which must also share a word stem
+PHRASE_THRESHOLD = 0.6
+STEM_LENGTH = 4
+# Shorter strings share too few n-grams to be matched reliably
+MIN_LENGTH = 4
+# Share of each word's n-grams a window must contain to match a phrase
+COVERAGE = 0.5
+
+
+# Character n-grams of a phrase with the spaces taken out, so "heart burn"
+# and "heartburn" or "nose bleed" and "nosebleed" look the same
+def ngrams(words, n=NGRAM):
+    text = f" {''.join(words)} "
+    return [text[i:i + n] for i in range(len(text) - n + 1)]
+
+
+def _inner_ngrams(text, n=NGRAM):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+# Typo-tolerant lookup of known phrases (condition names, aliases,
+# symptoms) by character n-gram TF-IDF. Phrases are rows of a normalised
+# matrix built once; candidate word windows from any number of messages
+# are vectorised together and scored in one matrix product.
+class FuzzyIndex:
+    def __init__(self, entries, threshold=THRESHOLD):
+        self.threshold = threshold
+        phrases = [(phrase, key) for phrase, key in entries.items() if len(''.join(tokenize(phrase))) >= MIN_LENGTH]
+        self.phrases = [phrase for phrase, _ in phrases]
+        self.keys = [key for _, key in phrases]
+        self.max_words = max((len(tokenize(phrase)) for phrase in self.phrases), default=0)
+        # The n-grams of each word of each phrase, to check a window covers all of them
+        self.word_grams = [[grams for grams in map(_inner_ngrams, tokenize(phrase)) if grams]
+                           for phrase in self.phrases]
+
+        grams = [ngrams(tokenize(phrase)) for phrase in self.phrases]
+        self.columns = {}
+        document_frequency = []
+        for phrase_grams in grams:
+            for gram in set(phrase_grams):
+                column = self.columns.setdefault(gram, len(self.columns))
+                if column == len(document_frequency):
+                    document_frequency.append(0)
+                document_frequency[column] += 1
+        count = len(self.phrases)
+        self.idf = np.array([math.log((1 + count) / (1 + df)) + 1 for df in document_frequency], dtype=np.float32)
+        self.matrix = self._vectorize(grams)
+
+    def _vectorize(self, gram_lists):
+        matrix = np.zeros((len(gram_lists), len(self.columns)), dtype=np.float32)
+        for row, grams in enumerate(gram_lists):
+            for gram in grams:
+                column = self.columns.get(gram)
+                if column is not None:
+                    matrix[row, column] += 1
+        matrix *= self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return matrix / norms
+
+    # Word windows worth comparing: up to max_words long, not starting or
+    # ending on a stop word, and long enough to match reliably
+    def _windows(self, text):
+        words = tokenize(text)
+        ignored = stop_words()
+        windows = []
+        for start in range(len(words)):
+            if words[start] in ignored:
+                continue
+            for end in range(start + 1, min(len(words), start + self.max_words) + 1):
+                if words[end - 1] in ignored:
+                    continue
+                window = words[start:end]
+                if len(''.join(window)) >= MIN_LENGTH:
+                    windows.append((start, end, window))
+        return windows
+
+    # A window only matches a phrase if it has something of every word of
+    # it, in order: each phrase word is looked for in the window text after
+    # the part the previous word matched, so grams are never shared between
+    # words. "backpack" is close to "back pain" overall but has nothing of
+    # "pain", and the "ach" of "stomach" can't stand in for "ache" as well.
+    def _covers(self, window, phrase):
+        text = ''.join(window)
+        position = 0
+        for word in self.word_grams[phrase]:
+            found = {}
+            for i in range(position, len(text) - NGRAM + 1):
+                gram = text[i:i + NGRAM]
+                if gram in word and gram not in found:
+                    found[gram] = i
+            if len(found) < COVERAGE * len(word):
+                return False
+            position = max(found.values()) + 1 if found else position
+        return True
+
+    # Best non-overlapping matches above the threshold for each text
+    def match_many(self, texts):
+        windows = [self._windows(text) for text in texts]
+        flat = [window for text_windows in windows for window in text_windows]
+        if not flat or not self.phrases:
+            return [[] for _ in texts]
+
+        scores = self._vectorize([ngrams(window) for _, _, window in flat]) @ self.matrix.T
+        best = scores.argmax(axis=1)
+        best_scores = scores[np.arange(len(flat)), best]
+
+        results = []
+        offset = 0
+        for text_windows in windows:
+            candidates = []
+            for i, (start, end, window) in enumerate(text_windows, offset):
+                if best_scores[i] >= self.threshold and self._covers(window, best[i]):
+                    phrase = best[i]
+                    candidates.append(FuzzyMatch(self.keys[phrase], self.phrases[phrase],
+                                                 float(best_scores[i]), start, end))
+            offset += len(text_windows)
+
+            chosen = []
+            for candidate in sorted(candidates, key=_rank, reverse=True):
+                if all(candidate.end <= m.start or candidate.start >= m.end for m in chosen):
+                    chosen.append(candidate)
+            results.append(sorted(chosen, key=lambda m: m.start))
+        return results
+
+    def match(self, text):
+        return self.match_many([text])[0]
+
+    def best_match(self, text):
+        matches = self.match(text)
+        return max(matches, key=_rank) if matches else None
+
+    # The key of the closest known phrase for each whole phrase, or None.
+    # Phrases are compared as they are rather than by word windows, and
+    # only count if they start a word the same way as the known phrase
+    # ("stomach hurts" -> "stomach ache", "feel nauseous" -> "nausea").
+    def lookup(self, phrases, threshold=PHRASE_THRESHOLD):
+        if not phrases or not self.phrases:
+            return [None] * len(phrases)
+        words = [tokenize(phrase) for phrase in phrases]
+        scores = self._vectorize([ngrams(phrase_words) for phrase_words in words]) @ self.matrix.T
+        keys = []
+        for phrase_words, phrase_scores in zip(words, scores):
+            best = int(phrase_scores.argmax())
+            stems = {word[:STEM_LENGTH] for word in tokenize(self.phrases[best]) if len(word) >= STEM_LENGTH}
+            shares_stem = any(word[:STEM_LENGTH] in stems for word in phrase_words)
+            keys.append(self.keys[best] if phrase_scores[best] >= threshold and shares_stem else None)
+        return keys
+
+
+# Higher scores first; between (near) equal scores the longer window wins,
+# so "heart burn" beats the "burn" inside it
+def _rank(match):
+    return round(match.score, 3), match.end - match.start
+
+
+# Condition names and their aliases, each pointing at the condition
+def build_condition_index(conditions, aliases):
+    entries = {condition: condition for condition in conditions}
+    entries.update({alias: key for alias, key in aliases.items() if key in entries})
+    return FuzzyIndex(entries)
+
+
+def build_symptom_index(symptoms):
+    return FuzzyIndex({symptom: symptom for symptom in symptoms})
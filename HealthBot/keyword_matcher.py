@@ -0,0 +1,89 @@
+import re
+from collections import namedtuple
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+Match = namedtuple('Match', ['key', 'kind', 'start', 'end'])
+
+_END = object()
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+# Word-level trie over every greeting, condition name and alias.
+# Matching walks the trie once from each token of the input, so phrases
+# only match on whole words ("hi" no longer fires inside "chills") and
+# the cost depends on the input length, not on how many keys there are.
+class KeywordMatcher:
+    def __init__(self):
+        self.root = {}
+        self.max_length = 0
+
+    # kind ranks the match ('condition' beats 'greeting'), key is what the
+    # caller gets back, so aliases point at their canonical entry
+    def add(self, phrase, key, kind):
+        tokens = tokenize(phrase)
+        if not tokens:
+            return
+        node = self.root
+        for token in tokens:
+            node = node.setdefault(token, {})
+        node[_END] = (key, kind)
+        self.max_length = max(self.max_length, len(tokens))
+
+    def find_all(self, text):
+        tokens = tokenize(text)
+        matches = []
+        for start in range(len(tokens)):
+            node = self.root
+            for end in range(start, min(len(tokens), start + self.max_length)):
+                node = node.get(tokens[end])
+                if node is None:
+                    break
+                if _END in node:
+                    key, kind = node[_END]
+                    matches.append(Match(key, kind, start, end + 1))
+        return matches
+
+    # Most specific match: conditions over greetings, then the longest
+    # phrase, then the earliest one in the input
+    def best_match(self, text):
+        matches = self.find_all(text)
+        if not matches:
+            return None
+        return max(matches, key=lambda m: (m.kind == 'condition', m.end - m.start, -m.start))
+
+    # Longest non-overlapping matches from left to right, so "chest pain"
+    # is found once rather than as both "chest pain" and "pain"
+    def find_longest(self, text):
+        chosen = []
+        position = 0
+        for match in sorted(self.find_all(text), key=lambda m: (m.start, m.start - m.end)):
+            if match.start >= position:
+                chosen.append(match)
+                position = match.end
+        return chosen
+
+
+def build_keyword_matcher(greetings, conditions, aliases=None):
+    matcher = KeywordMatcher()
+    for key in greetings:
+        matcher.add(key, key, 'greeting')
+    for condition in conditions:
+        matcher.add(condition, condition, 'condition')
+    for alias, key in (aliases or {}).items():
+        if key in conditions:
+            matcher.add(alias, key, 'condition')
+        elif key in greetings:
+            matcher.add(alias, key, 'greeting')
+    return matcher
+
+
+# Matcher over the known symptom vocabulary, for the no-parse fast path
+def build_symptom_matcher(symptoms):
+    matcher = KeywordMatcher()
+    for symptom in symptoms:
+        matcher.add(symptom, symptom, 'symptom')
+    return matcher
@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+
+from cache import normalize
+from scoring import match_symptoms
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(HERE, 'knowledge.json')
+COMPILED_PATH = os.path.join(HERE, 'knowledge.db')
+
+ADVICE_FIELDS = ('symptoms', 'causes', 'treatment', 'prevention')
+
+SCHEMA = '''
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE greetings (key TEXT PRIMARY KEY, response TEXT NOT NULL);
+CREATE TABLE aliases (alias TEXT PRIMARY KEY, key TEXT NOT NULL);
+CREATE TABLE general_responses (id INTEGER PRIMARY KEY, response TEXT NOT NULL);
+CREATE TABLE symptom_weights (id INTEGER PRIMARY KEY, symptom TEXT UNIQUE NOT NULL, weight REAL NOT NULL);
+CREATE TABLE conditions (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    symptoms TEXT NOT NULL,
+    causes TEXT NOT NULL,
+    treatment TEXT NOT NULL,
+    prevention TEXT NOT NULL
+);
+CREATE TABLE condition_symptoms (condition TEXT NOT NULL, symptom TEXT NOT NULL);
+CREATE VIRTUAL TABLE advice_fts USING fts5(
+    name, symptoms, causes, treatment, prevention,
+    content='conditions', content_rowid='id', prefix='2 3'
+);
+'''
+
+
+def source_version(source=DATA_PATH):
+    with open(source, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+# Compile the JSON knowledge base into an indexed SQLite file. The file is
+# written next to the target and moved into place in one step, so readers
+# never see a half-written database.
+def compile_knowledge(source=DATA_PATH, target=COMPILED_PATH):
+    with open(source, 'rb') as f:
+        raw = f.read()
+    data = json.loads(raw)
+    version = hashlib.sha256(raw).hexdigest()
+
+    fd, tmp_path = tempfile.mkstemp(suffix='.db', dir=os.path.dirname(target))
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(tmp_path)
+        with conn:
+            conn.executescript(SCHEMA)
+            conn.execute('INSERT INTO meta VALUES (?, ?)', ('version', version))
+            conn.executemany('INSERT INTO greetings VALUES (?, ?)', data['greetings'].items())
+            conn.executemany('INSERT INTO aliases VALUES (?, ?)', data['aliases'].items())
+            conn.executemany('INSERT INTO general_responses (response) VALUES (?)',
+                             ((response,) for response in data['general_responses']))
+            conn.executemany('INSERT INTO symptom_weights (symptom, weight) VALUES (?, ?)',
+                             data['symptom_weights'].items())
+            for name, info in data['health_advice'].items():
+                conn.execute('INSERT INTO conditions (name, symptoms, causes, treatment, prevention) '
+                             'VALUES (?, ?, ?, ?, ?)', (name, *(info[field] for field in ADVICE_FIELDS)))
+                conn.executemany('INSERT INTO condition_symptoms VALUES (?, ?)',
+                                 ((name, symptom) for symptom in match_symptoms(info['symptoms'], data['symptom_weights'])))
+            conn.execute("INSERT INTO advice_fts (advice_fts) VALUES ('rebuild')")
+        conn.close()
+        os.replace(tmp_path, target)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return version
+
+
+# Read-only view of a compiled knowledge base. The small lookup tables
+# are read when it is opened; full advice records are fetched the first
+# time each condition is asked about.
+class KnowledgeBase:
+    def __init__(self, path=COMPILED_PATH):
+        self.path = path
+        self._conn = self._connect()
+        self._lock = threading.Lock()
+        self._records = {}
+
+        query = self._conn.execute
+        self.version = query("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+        self.greetings = dict(query('SELECT key, response FROM greetings'))
+        self.aliases = dict(query('SELECT alias, key FROM aliases'))
+        self.general_responses = [row[0] for row in query('SELECT response FROM general_responses ORDER BY id')]
+        self.symptom_weights = dict(query('SELECT symptom, weight FROM symptom_weights ORDER BY id'))
+        self.condition_names = [row[0] for row in query('SELECT name FROM conditions ORDER BY id')]
+
+    def _connect(self):
+        return sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, check_same_thread=False)
+
+    # SQLite connections must not be used across fork(): close the
+    # connection before forking and reopen it in each child
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def reopen(self):
+        with self._lock:
+            self._conn = self._connect()
+
+    # Symptoms (from symptom_weights) mentioned by each condition
+    def condition_symptoms(self):
+        result = {name: [] for name in self.condition_names}
+        with self._lock:
+            for condition, symptom in self._conn.execute('SELECT condition, symptom FROM condition_symptoms'):
+                result[condition].append(symptom)
+        return result
+
+    # Full advice record for one condition, as a dict in ADVICE_FIELDS order
+    def condition(self, name):
+        record = self._records.get(name)
+        if record is None:
+            with self._lock:
+                row = self._conn.execute(f'SELECT {", ".join(ADVICE_FIELDS)} FROM conditions WHERE name = ?',
+                                         (name,)).fetchone()
+            if row is None:
+                raise KeyError(name)
+            record = dict(zip(ADVICE_FIELDS, row))
+            self._records[name] = record
+        return record
+
+    # Conditions whose advice text best matches a free-text query, ranked
+    # by BM25 with the condition name and symptoms weighted highest. Every
+    # word is matched as a prefix, so "migr" finds migraine.
+    def search(self, query, limit=3):
+        words = [word for word in normalize(query).split() if len(word) > 1]
+        if not words:
+            return []
+        match = ' OR '.join(f'"{word}"*' for word in words)
+        with self._lock:
+            rows = self._conn.execute('SELECT name FROM advice_fts WHERE advice_fts MATCH ? '
+                                      'ORDER BY bm25(advice_fts, 10.0, 5.0, 1.0, 1.0, 1.0) LIMIT ?',
+                                      (match, limit)).fetchall()
+        return [row[0] for row in rows]
+
+
+def _compiled_version(target):
+    try:
+        conn = sqlite3.connect(f'file:{target}?mode=ro', uri=True)
+        try:
+            return conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+
+
+# Open the compiled knowledge base, recompiling it first if the JSON
+# source has changed since it was built
+def load_knowledge(source=DATA_PATH, target=COMPILED_PATH):
+    if _compiled_version(target) != source_version(source):
+        compile_knowledge(source, target)
+    return KnowledgeBase(target)
+
+
+# Background thread that calls on_change whenever the source file changes
+class KnowledgeWatcher(threading.Thread):
+    def __init__(self, on_change, source=DATA_PATH, interval=2.0):
+        super().__init__(name='knowledge-watcher', daemon=True)
+        self.on_change = on_change
+        self.source = source
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def _mtime(self):
+        try:
+            return os.stat(self.source).st_mtime_ns
+        except OSError:
+            return None
+
+    def run(self):
+        last = self._mtime()
+        while not self._stopped.wait(self.interval):
+            current = self._mtime()
+            if current != last:
+                last = current
+                try:
+                    self.on_change()
+                except Exception as e:
+                    print(f"Knowledge base reload failed: {e}")
+
+    def stop(self):
+        self._stopped.set()
@@ -0,0 +1,125 @@
+import argparse
+import asyncio
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+_started = time.perf_counter()
+
+
+# Run one startup step and record how long it took
+def timed(timings, label, func):
+    start = time.perf_counter()
+    result = func()
+    timings.append((label, time.perf_counter() - start))
+    return result
+
+
+# Import and initialise everything a worker needs, in the order a worker
+# would, and return the time spent in each step
+def preload():
+    timings = []
+    timed(timings, 'import numpy', lambda: __import__('numpy'))
+    responder = timed(timings, 'import responder', lambda: __import__('responder'))
+    timed(timings, 'load knowledge base', responder.get_state)
+    engine = timed(timings, 'import spaCy + load model', responder.get_engine)
+    timed(timings, 'warm-up parse', engine.warm_up)
+
+    # Split the combined step using the engine's own timers
+    index = [label for label, _ in timings].index('import spaCy + load model')
+    timings[index:index + 1] = [('import spaCy', engine.import_seconds),
+                                ('load model', engine.load_seconds)]
+    return timings
+
+
+def print_report(timings):
+    total = sum(seconds for _, seconds in timings)
+    print("Startup time report")
+    for label, seconds in timings:
+        share = 100 * seconds / total if total else 0.0
+        print(f"  {label:<28}{seconds * 1000:9.1f} ms  {share:5.1f}%")
+    print(f"  {'total':<28}{total * 1000:9.1f} ms")
+    print(f"  {'(since launcher start)':<28}{(time.perf_counter() - _started) * 1000:9.1f} ms")
+
+
+def run_worker(sock, threads, batch_size):
+    import responder
+    from server import HealthBotServer
+
+    # The parent closed its knowledge base connection before forking
+    responder.get_state().kb.reopen()
+    # Threads don't survive fork, so each worker starts its own watcher
+    responder.watch_knowledge()
+    responder.install_reload_signal()
+    try:
+        asyncio.run(HealthBotServer(threads, batch_size).serve(sock=sock))
+    except KeyboardInterrupt:
+        pass
+    os._exit(0)
+
+
+# Load the model once in this process, then fork workers that share it
+# copy-on-write and accept connections from the same listening socket
+def prefork(args):
+    sock = socket.create_server((args.host, args.port))
+    sock.set_inheritable(True)
+
+    timings = preload()
+    if args.report:
+        print_report(timings)
+    import responder
+    responder.get_state().kb.close()
+
+    # Move everything loaded so far out of the garbage collector's view, so
+    # collections in the workers don't touch (and copy) the shared pages
+    gc.freeze()
+
+    children = []
+    for _ in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            run_worker(sock, args.threads, args.batch_size)
+        children.append(pid)
+    sock.close()
+    print(f"Started {len(children)} workers on http://{args.host}:{args.port}")
+
+    def forward(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGHUP, forward)
+    try:
+        for _ in children:
+            os.wait()
+    except KeyboardInterrupt:
+        forward(signal.SIGTERM, None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Preload HealthBot and fork API workers that share the model.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument('--threads', type=int, default=4, help="NLP threads per worker")
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--report', action='store_true', help="print the startup time report")
+    parser.add_argument('--report-only', action='store_true', help="print the startup time report and exit")
+    args = parser.parse_args(argv)
+
+    if args.report_only:
+        print_report(preload())
+        return
+    if not hasattr(os, 'fork'):
+        sys.exit("Preforking needs os.fork; run server.py directly on this platform.")
+    prefork(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+import argparse
+import json
+import multiprocessing
+import os
+import pickle
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from streamlit.testing.v1 import AppTest
+
+import admission
+import metrics
+import responder
+from benchmark import build_corpus
+from metrics import percentile
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+PAGES = ["Health Tips", "Recent Health Trends", "Symptom Checker", "Fitness Tracker", "Nutrition Advice", "None"]
+SCRIPT_TIMEOUT = 60
+
+
+def _rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+# Drives one browser session through the real app script with AppTest and
+# records how long each step's rerun took. AppTest keeps a process-wide
+# runtime, so sessions in one process run one after another and
+# concurrency comes from running several processes (see run_load_test).
+class SimulatedUser:
+    def __init__(self, username, messages, think_time, rng):
+        self.username = username
+        self.password = 'pw-' + username
+        self.messages = messages
+        self.think_time = think_time
+        self.rng = rng
+        self.timings = []
+        self.errors = []
+        self.app = AppTest.from_file(APP_PATH, default_timeout=SCRIPT_TIMEOUT)
+
+    def step(self, action, func):
+        if self.think_time:
+            time.sleep(self.rng.uniform(0, 2 * self.think_time))
+        start = time.perf_counter()
+        try:
+            func()
+        except Exception as e:
+            self.errors.append(f"{action}: {e!r}")
+            return
+        self.timings.append((action, time.perf_counter() - start))
+        for exception in self.app.exception:
+            self.errors.append(f"{action}: {exception.message}")
+
+    def button(self, label):
+        return next(button for button in list(self.app.button) + list(self.app.sidebar.button) if button.label == label)
+
+    def fill_credentials(self, option, button):
+        self.app.sidebar.selectbox[0].set_value(option).run()
+        self.app.text_input[0].set_value(self.username)
+        self.app.text_input[1].set_value(self.password)
+        return self.button(button).click().run()
+
+    def run(self):
+        self.step('first_load', self.app.run)
+        self.step('register', lambda: self.fill_credentials("Register", "Register"))
+        # Logging in and out only changes the page on the next rerun, like
+        # the second click the readme mentions
+        self.step('login', lambda: self.fill_credentials("Login", "Login").run())
+        if not self.app.session_state['logged_in']:
+            self.errors.append("login: still logged out")
+            return self
+        for message in self.messages:
+            self.step('chat', lambda: self.app.chat_input[0].set_value(message).run())
+        for page in self.rng.sample(PAGES, len(PAGES)):
+            self.step('page', lambda: self.app.sidebar.selectbox[0].set_value(page).run())
+        self.session_bytes = self.session_size()
+        self.step('logout', lambda: self.button("Logout").click().run().run())
+        return self
+
+    # Pickled size of what the session keeps in st.session_state
+    def session_size(self):
+        size = 0
+        for key in self.app.session_state.keys():
+            try:
+                size += len(pickle.dumps(self.app.session_state[key]))
+            except Exception:
+                pass
+        return size
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'p50_ms': 1000 * percentile(values, 50),
+        'p95_ms': 1000 * percentile(values, 95),
+        'p99_ms': 1000 * percentile(values, 99),
+        'max_ms': 1000 * values[-1] if values else 0.0,
+    }
+
+
+# Raw user store call histograms, so workers' numbers can be added up.
+# Lock waits show up as a long tail here (busy_timeout turns them into waits).
+def db_histograms():
+    return {hist.labels['stage']: (list(hist.counts), hist.sum)
+            for hist in metrics.histograms('healthbot_db_seconds')}
+
+
+def db_summary(worker_histograms):
+    merged = {}
+    for histograms in worker_histograms:
+        for stage, (counts, total) in histograms.items():
+            hist = merged.setdefault(stage, metrics.Histogram('healthbot_db_seconds', ''))
+            hist.counts = [a + b for a, b in zip(hist.counts, counts)]
+            hist.sum += total
+    return {stage: {
+        'count': hist.count,
+        'mean_ms': 1000 * hist.sum / hist.count if hist.count else 0.0,
+        'p50_ms': 1000 * hist.quantile(0.5),
+        'p95_ms': 1000 * hist.quantile(0.95),
+        'p99_ms': 1000 * hist.quantile(0.99),
+    } for stage, hist in merged.items()}
+
+
+# One worker process: run its users in turn, keeping every finished
+# session alive so the memory they hold can be measured
+def run_worker(specs, think_time, db_dir):
+    os.chdir(db_dir)
+    os.environ.setdefault('HEALTHBOT_STARTUP', 'lazy')
+    responder.get_state()
+    # The first session also pays for lazy imports (spaCy, the model), so
+    # memory per session is measured from the end of the first one
+    sims = []
+    rss_start = None
+    for username, messages, seed in specs:
+        sims.append(SimulatedUser(username, messages, think_time, random.Random(seed)).run())
+        if rss_start is None:
+            rss_start = _rss_mb()
+    return {
+        'timings': [timing for sim in sims for timing in sim.timings],
+        'errors': [error for sim in sims for error in sim.errors],
+        'session_bytes': [sim.session_bytes for sim in sims if hasattr(sim, 'session_bytes')],
+        'rss_start_mb': rss_start,
+        'rss_end_mb': _rss_mb(),
+        'sessions': len(sims),
+        'db': db_histograms(),
+        'admission': admission.stats(),
+    }
+
+
+def run_load_test(users, concurrency, messages, think_time, seed, db_dir):
+    rng = random.Random(seed)
+    corpus = build_corpus(responder.get_state().kb, users * messages, seed)
+    queries = [query for kind in ('greeting', 'condition', 'symptom', 'free_text', 'miss') for query in corpus[kind]]
+    run_id = f'{int(time.time())}-{os.getpid()}'
+    specs = [(f'load-{run_id}-{i}', rng.sample(queries, messages), rng.random()) for i in range(users)]
+    # Workers log their queries next to the throwaway users.db rather than
+    # into the real analytics/ directory
+    os.environ['HEALTHBOT_ANALYTICS_DIR'] = os.path.join(db_dir, 'analytics')
+
+    # Workers are spawned rather than forked: this process already has the
+    # knowledge base's SQLite connection open, which must not cross a fork
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=concurrency, mp_context=multiprocessing.get_context('spawn')) as executor:
+        results = list(executor.map(run_worker, [specs[i::concurrency] for i in range(concurrency)],
+                                    [think_time] * concurrency, [db_dir] * concurrency))
+    elapsed = time.perf_counter() - start
+    results = [result for result in results if result['sessions']]
+
+    timings = {}
+    for result in results:
+        for action, seconds in result['timings']:
+            timings.setdefault(action, []).append(seconds)
+    errors = [error for result in results for error in result['errors']]
+    lock_errors = sum('database is locked' in error for error in errors)
+    session_sizes = [size for result in results for size in result['session_bytes']]
+    growth = [(result['rss_end_mb'] - result['rss_start_mb']) / (result['sessions'] - 1)
+              for result in results if result['sessions'] > 1]
+    admitted = {}
+    for result in results:
+        for outcome, count in result['admission'].items():
+            admitted[outcome] = admitted.get(outcome, 0) + count
+
+    return {
+        'meta': {'users': users, 'concurrency': concurrency, 'messages': messages,
+                 'think_time': think_time, 'seed': seed, 'elapsed_s': elapsed},
+        'reruns': {action: summarize(values) for action, values in timings.items()},
+        'all_reruns': summarize([seconds for values in timings.values() for seconds in values]),
+        'memory': {
+            'worker_rss_mb': max((result['rss_end_mb'] for result in results), default=0.0),
+            'rss_per_session_kb': 1024 * sum(growth) / len(growth) if growth else 0.0,
+            'session_state_kb': sum(session_sizes) / len(session_sizes) / 1024 if session_sizes else 0.0,
+        },
+        'sqlite': {'calls': db_summary(result['db'] for result in results), 'lock_errors': lock_errors},
+        'admission': admitted,
+        'errors': errors[:20],
+        'error_count': len(errors),
+    }
+
+
+def print_report(report):
+    meta = report['meta']
+    print(f"{meta['users']} users, {meta['concurrency']} at a time, {meta['messages']} messages each, "
+          f"{meta['elapsed_s']:.1f}s")
+    print("Script reruns (ms)")
+    for action, stats in list(report['reruns'].items()) + [('all', report['all_reruns'])]:
+        print(f"  {action:<12}n={stats['count']:<6}p50={stats['p50_ms']:8.1f}  p95={stats['p95_ms']:8.1f}  "
+              f"p99={stats['p99_ms']:8.1f}  max={stats['max_ms']:8.1f}")
+    memory = report['memory']
+    print(f"Memory: largest worker RSS {memory['worker_rss_mb']:.1f} MB, ~{memory['rss_per_session_kb']:.0f} KB "
+          f"per session, session_state {memory['session_state_kb']:.1f} KB")
+    print("SQLite calls (ms)")
+    for call, stats in report['sqlite']['calls'].items():
+        print(f"  {call:<14}n={stats['count']:<6}mean={stats['mean_ms']:7.2f}  p95<={stats['p95_ms']:6.2f}  "
+              f"p99<={stats['p99_ms']:6.2f}")
+    print(f"  'database is locked' errors: {report['sqlite']['lock_errors']}")
+    print("Admission: " + ', '.join(f"{outcome}={count}" for outcome, count in report['admission'].items()))
+    if report['error_count']:
+        print(f"{report['error_count']} error(s), first ones:")
+        for error in report['errors']:
+            print("  " + error)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate many HealthBot users driving app.py headlessly.")
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=8, help="users active at the same time (worker processes)")
+    parser.add_argument('--messages', type=int, default=5, help="chat messages per user")
+    parser.add_argument('--think-time', type=float, default=0.0, help="mean pause between steps, seconds")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--db-dir', help="directory for users.db (default: a fresh temporary one)")
+    parser.add_argument('--output', help="also write the report as JSON")
+    args = parser.parse_args(argv)
+
+    if args.output:
+        args.output = os.path.abspath(args.output)
+    # The app keeps users.db in the working directory, so run it somewhere
+    # that doesn't touch the real one
+    tmp = None
+    if args.db_dir is None:
+        tmp = tempfile.TemporaryDirectory()
+        args.db_dir = tmp.name
+
+    report = run_load_test(args.users, min(args.concurrency, args.users), args.messages, args.think_time, args.seed,
+                           os.path.abspath(args.db_dir))
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if tmp is not None:
+        tmp.cleanup()
+    sys.exit(1 if report['error_count'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+import bisect
+import functools
+import os
+import threading
+import time
+
+# Set HEALTHBOT_METRICS=0 to turn instrumentation off. It is read once at
+# import, and when off the decorators below hand back the original
+# functions untouched, so there is no per-call cost at all.
+ENABLED = os.environ.get('HEALTHBOT_METRICS', '1') != '0'
+
+# Latency bucket upper bounds in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+# Fixed-bucket latency histogram, cheap enough for the hot path
+class Histogram:
+    def __init__(self, name, help_text, labels=None):
+        self.name = name
+        self.help = help_text
+        self.labels = labels or {}
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += seconds
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    # Estimated quantile (upper bound of the bucket it falls in)
+    def quantile(self, q):
+        total = self.count
+        if not total:
+            return 0.0
+        target = q * total
+        seen = 0
+        for bound, count in zip(BUCKETS + (float('inf'),), self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=None):
+        self.name = name
+        self.help = help_text
+        self.labels = labels or {}
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+_histograms = {}
+_counters = {}
+_collectors = []
+_registry_lock = threading.Lock()
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def histogram(name, help_text, **labels):
+    key = (name, _label_key(labels))
+    with _registry_lock:
+        if key not in _histograms:
+            _histograms[key] = Histogram(name, help_text, labels)
+        return _histograms[key]
+
+
+def counter(name, help_text, **labels):
+    key = (name, _label_key(labels))
+    with _registry_lock:
+        if key not in _counters:
+            _counters[key] = Counter(name, help_text, labels)
+        return _counters[key]
+
+
+# Registered histograms, optionally only those of one metric
+def histograms(name=None):
+    with _registry_lock:
+        return [hist for hist in _histograms.values() if name is None or hist.name == name]
+
+
+# Register a function returning (name, help, labels, value) tuples that is
+# called at scrape time, for values other modules already keep. Values
+# that only ever go up are exported with kind='counter'.
+def register_collector(collect, kind='gauge'):
+    if ENABLED:
+        _collectors.append((collect, kind))
+
+
+# Time every call of the decorated function into a per-stage histogram
+def timed(stage, metric='healthbot_stage_seconds', help_text='Time spent in each response stage.'):
+    def decorate(func):
+        if not ENABLED:
+            return func
+        hist = histogram(metric, help_text, stage=stage)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                hist.observe(time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels.items()) + list((extra or {}).items())
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in items) + '}'
+
+
+# Everything in the Prometheus text exposition format
+def render_prometheus():
+    lines = []
+    described = set()
+
+    def describe(name, help_text, kind):
+        if name not in described:
+            described.add(name)
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+    with _registry_lock:
+        histograms = list(_histograms.values())
+        counters = list(_counters.values())
+
+    for hist in histograms:
+        describe(hist.name, hist.help, 'histogram')
+        with hist._lock:
+            counts = list(hist.counts)
+            total = hist.sum
+        cumulative = 0
+        for bound, count in zip(BUCKETS + (float('inf'),), counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'{hist.name}_bucket{_format_labels(hist.labels, {"le": le})} {cumulative}')
+        lines.append(f'{hist.name}_sum{_format_labels(hist.labels)} {total}')
+        lines.append(f'{hist.name}_count{_format_labels(hist.labels)} {cumulative}')
+
+    for c in counters:
+        describe(c.name, c.help, 'counter')
+        lines.append(f'{c.name}{_format_labels(c.labels)} {c.value}')
+
+    # Collected samples are grouped so each metric family is contiguous
+    families = {}
+    for collect, kind in _collectors:
+        for name, help_text, labels, value in collect():
+            families.setdefault(name, (help_text, kind, []))[2].append(f'{name}{_format_labels(labels)} {value}')
+    for name, (help_text, kind, samples) in families.items():
+        describe(name, help_text, kind)
+        lines.extend(samples)
+
+    return '\n'.join(lines) + '\n'
+
+
+# Per-stage summary rows for the admin page
+def stage_summary():
+    with _registry_lock:
+        histograms = list(_histograms.values())
+    rows = []
+    for hist in histograms:
+        count = hist.count
+        rows.append({
+            'metric': hist.name,
+            **hist.labels,
+            'count': count,
+            'mean_ms': round(1000 * hist.sum / count, 3) if count else 0.0,
+            'p50_ms': 1000 * hist.quantile(0.5),
+            'p95_ms': 1000 * hist.quantile(0.95),
+            'p99_ms': 1000 * hist.quantile(0.99),
+        })
+    return rows
+
+
+# Exact percentile of already sorted values, for offline reports
+# (benchmarks, load tests, the query log summary)
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
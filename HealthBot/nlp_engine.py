@@ -0,0 +1,115 @@
+import threading
+import time
+from itertools import islice
+
+MODEL_NAME = 'en_core_web_sm'
+
+# The symptom patterns only look at POS tags and dependency labels, so the
+# components that produce neither are never loaded
+EXCLUDED_COMPONENTS = ['ner', 'lemmatizer']
+
+# Patterns for common symptom expressions
+SYMPTOM_PATTERNS = [
+    [{"POS": "ADJ", "DEP": "amod"}, {"POS": "NOUN"}],  # Example: "high fever"
+    [{"POS": "VERB", "DEP": "ROOT"}, {"POS": "NOUN"}],  # Example: "have a headache"
+    [{"POS": "NOUN"}, {"POS": "ADJ"}],  # Example: "painful throat"
+    [{"POS": "VERB"}, {"POS": "ADJ"}],  # Example: "feel dizzy"
+]
+
+
+# Holds the loaded spaCy pipeline and the compiled symptom matcher.
+# One instance is shared by every session in the process, so calls into
+# the pipeline go through a lock. spaCy itself is only imported here, so
+# pages that never parse anything don't pay for it.
+class NLPEngine:
+    def __init__(self, model_name=MODEL_NAME):
+        start = time.perf_counter()
+        import spacy
+        from spacy.matcher import Matcher
+        from spacy.lang.en import STOP_WORDS
+        self.import_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.model_name = model_name
+        self.stop_words = STOP_WORDS
+        self.nlp = spacy.load(model_name, exclude=EXCLUDED_COMPONENTS)
+        self.matcher = Matcher(self.nlp.vocab)
+        self.matcher.add("SYMPTOM", SYMPTOM_PATTERNS)
+        self._lock = threading.Lock()
+        self.warmed_up = False
+        self.load_seconds = time.perf_counter() - start
+
+    # Pull symptom phrases out of already parsed docs
+    def symptoms_from_doc(self, doc):
+        extracted_symptoms = []
+        for match_id, start, end in self.matcher(doc):
+            span = doc[start:end]
+            extracted_symptoms.append(span.text)
+        # Remove stop words and duplicates
+        extracted_symptoms = [entity for entity in extracted_symptoms if entity not in self.stop_words]
+        return list(set(extracted_symptoms))
+
+    def extract_symptoms(self, user_input):
+        with self._lock:
+            doc = self.nlp(user_input)
+            return self.symptoms_from_doc(doc)
+
+    # Stream many texts through nlp.pipe, yields one symptom list per text.
+    # The lock is taken for one batch at a time, so single messages parsed
+    # by other threads get a turn between batches of a long stream.
+    def pipe(self, texts, batch_size=64, n_process=1):
+        texts = iter(texts)
+        while True:
+            chunk = list(islice(texts, batch_size * n_process))
+            if not chunk:
+                return
+            with self._lock:
+                symptoms = [self.symptoms_from_doc(doc)
+                            for doc in self.nlp.pipe(chunk, batch_size=batch_size, n_process=n_process)]
+            yield from symptoms
+
+    # Run a throwaway parse so the first real message doesn't pay for
+    # lazy initialisation inside the pipeline
+    def warm_up(self):
+        if not self.warmed_up:
+            self.extract_symptoms("I have a high fever and feel dizzy")
+            self.warmed_up = True
+        return self
+
+
+# Hit counts and cumulative latency for each tier of symptom extraction
+class TierStats:
+    def __init__(self, tiers):
+        self._lock = threading.Lock()
+        self._stats = {tier: {'hits': 0, 'seconds': 0.0} for tier in tiers}
+
+    def record(self, tier, seconds):
+        with self._lock:
+            self._stats[tier]['hits'] += 1
+            self._stats[tier]['seconds'] += seconds
+
+    def snapshot(self):
+        with self._lock:
+            total = sum(stats['hits'] for stats in self._stats.values())
+            return {
+                tier: {
+                    'hits': stats['hits'],
+                    'hit_rate': stats['hits'] / total if total else 0.0,
+                    'mean_ms': 1000 * stats['seconds'] / stats['hits'] if stats['hits'] else 0.0,
+                }
+                for tier, stats in self._stats.items()
+            }
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+# Process-wide engine, created on first use
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = NLPEngine()
+    return _engine
@@ -0,0 +1,162 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import metrics
+from nlp_engine import MODEL_NAME
+
+# Parser processes shared by every session in this process. 0 keeps the
+# parse in-process (see nlp_engine.get_engine).
+WORKERS = int(os.environ.get('HEALTHBOT_NLP_WORKERS', 0))
+# A micro-batch is sent off when it holds MAX_BATCH messages or its first
+# message has waited MAX_WAIT_MS, whichever comes first
+MAX_BATCH = int(os.environ.get('HEALTHBOT_NLP_MAX_BATCH', 16))
+MAX_WAIT_MS = float(os.environ.get('HEALTHBOT_NLP_MAX_WAIT_MS', 5))
+
+_STOP = object()
+
+_batches = metrics.counter('healthbot_nlp_batches_total', 'Micro-batches sent to the parser processes.')
+_batched = metrics.counter('healthbot_nlp_batched_messages_total', 'Messages parsed in micro-batches.')
+
+WARM_UP_TEXT = "I have a high fever and feel dizzy"
+# Longest warm_up waits for the worker processes to load the model
+WARM_UP_TIMEOUT = 120
+
+# The engine inside each worker process
+_worker_engine = None
+
+
+# Runs once in each worker process as it starts; ready is released when
+# the model is loaded, so the parent can tell every process is warm
+def _init_worker(model_name, ready):
+    global _worker_engine
+    from nlp_engine import NLPEngine
+    _worker_engine = NLPEngine(model_name).warm_up()
+    ready.release()
+
+
+def _parse_batch(texts):
+    return list(_worker_engine.pipe(texts, batch_size=len(texts)))
+
+
+# Parses messages on a pool of worker processes, each with its own copy
+# of the model, so parsing uses more than one core and stays off the GIL
+# the sessions share. Messages submitted at about the same time are
+# grouped into micro-batches and run through nlp.pipe together. While
+# every worker is busy, new messages keep collecting, so batches grow
+# with the load; when idle, a message waits at most max_wait_ms.
+class NLPService:
+    def __init__(self, workers=WORKERS or 1, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS, model_name=MODEL_NAME,
+                 start_method='spawn'):
+        self.workers = workers
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._requests = queue.SimpleQueue()
+        context = multiprocessing.get_context(start_method)
+        self._ready = context.Semaphore(0)
+        self._pool = ProcessPoolExecutor(workers, mp_context=context,
+                                         initializer=_init_worker, initargs=(model_name, self._ready))
+        self.warmed_up = False
+        self._warm_up_lock = threading.Lock()
+        # One batch in flight per worker
+        self._slots = threading.Semaphore(workers)
+        self._dispatcher = threading.Thread(target=self._dispatch, name='nlp-dispatcher', daemon=True)
+        self._dispatcher.start()
+
+    # Queue a message, the future resolves to its symptom list
+    def submit(self, text):
+        future = Future()
+        self._requests.put((text, future))
+        return future
+
+    def parse(self, text, timeout=None):
+        return self.submit(text).result(timeout)
+
+    # Start the workers and wait until each has loaded the model, once.
+    # The warm-up parses go straight to the pool rather than through the
+    # dispatcher, which would put them all in one batch for one process;
+    # each submit starts another process while none is idle.
+    def warm_up(self):
+        if self.warmed_up:
+            return self
+        with self._warm_up_lock:
+            if not self.warmed_up:
+                futures = [self._pool.submit(_parse_batch, [WARM_UP_TEXT]) for _ in range(self.workers)]
+                for _ in range(self.workers):
+                    if not self._ready.acquire(timeout=WARM_UP_TIMEOUT):
+                        raise TimeoutError("NLP worker processes did not start")
+                for future in futures:
+                    future.result()
+                self.warmed_up = True
+        return self
+
+    def _next_batch(self):
+        batch = [self._requests.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch and batch[-1] is not _STOP:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._requests.get(timeout=remaining) if remaining > 0 else self._requests.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _dispatch(self):
+        while True:
+            self._slots.acquire()
+            batch = self._next_batch()
+            stopping = batch[-1] is _STOP
+            # Callers that gave up (cancelled futures) are skipped
+            batch = [(text, future) for text, future in batch[:-1 if stopping else None]
+                     if future.set_running_or_notify_cancel()]
+            if batch:
+                _batches.inc()
+                _batched.inc(len(batch))
+                result = self._pool.submit(_parse_batch, [text for text, _ in batch])
+                result.add_done_callback(lambda result, batch=batch: self._finish(batch, result))
+            else:
+                self._slots.release()
+            if stopping:
+                return
+
+    def _finish(self, batch, result):
+        self._slots.release()
+        try:
+            symptoms = result.result()
+        except BaseException as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), extracted_symptoms in zip(batch, symptoms):
+            future.set_result(extracted_symptoms)
+
+    # Finish what was submitted, then stop the workers
+    def shutdown(self):
+        self._requests.put(_STOP)
+        self._dispatcher.join()
+        self._pool.shutdown()
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_nlp_service():
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = NLPService()
+    return _service
+
+
+def _collect_metrics():
+    batches = _batches.value
+    yield ('healthbot_nlp_mean_batch_size', 'Average micro-batch size so far.', {},
+           round(_batched.value / batches, 2) if batches else 0.0)
+
+
+metrics.register_collector(_collect_metrics)
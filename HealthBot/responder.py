@@ -0,0 +1,487 @@
+import random
+import threading
+import time
+from collections import namedtuple
+
+import admission
+import analytics
+from cache import LRUCache, normalize
+from fuzzy import build_condition_index, build_symptom_index
+from knowledge import load_knowledge, KnowledgeWatcher
+from keyword_matcher import build_keyword_matcher, build_symptom_matcher, tokenize
+from nlp_engine import get_engine, TierStats
+import nlp_service
+import metrics
+from scoring import ScoringEngine
+from templates import ResponseTemplates, paragraphs
+
+# Minimum score for a condition to be listed as possible
+THRESHOLD = 2
+
+# Cache sizes, and how long a cached response stays valid (None: forever)
+RESPONSE_CACHE_SIZE = 1024
+RESPONSE_CACHE_TTL = None
+SYMPTOM_CACHE_SIZE = 4096
+
+# Messages that clear the symptoms collected over a conversation
+RESET_PHRASES = {'reset', 'start over', 'clear my symptoms', 'forget my symptoms', 'new symptoms'}
+RESET_RESPONSE = "Okay, I've forgotten the symptoms you mentioned. What's bothering you now?"
+# Words that make a message a question about a condition rather than a
+# report of a symptom ("what is a fever" vs "I have a fever")
+QUESTION_WORDS = {'what', 'whats', 'how', 'why', 'tell', 'explain', 'about', 'treat', 'cure'}
+
+response_cache = LRUCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+symptom_cache = LRUCache(SYMPTOM_CACHE_SIZE)
+
+# Tier 0 finds known symptoms by keyword, tier 1 runs the spaCy parse
+tier_stats = TierStats(['keyword', 'parser'])
+_MISSING = object()
+
+# What the request being answered on this thread ended up as (the stage
+# that answered it and the condition it was about), for the query log
+_request = threading.local()
+
+# Everything built from one version of the knowledge base. Requests take
+# the current snapshot once and use it throughout, so a reload swapping
+# in a new one never changes the data under a request in flight.
+KnowledgeState = namedtuple('KnowledgeState', ['kb', 'keyword_matcher', 'symptom_matcher', 'condition_fuzzy',
+                                               'symptom_fuzzy', 'scoring_engine', 'templates'])
+
+_state = None
+_build_lock = threading.Lock()
+_watcher = None
+
+
+def _build_state(kb):
+    return KnowledgeState(
+        kb,
+        build_keyword_matcher(kb.greetings, kb.condition_names, kb.aliases),
+        build_symptom_matcher(kb.symptom_weights),
+        build_condition_index(kb.condition_names, kb.aliases),
+        build_symptom_index(kb.symptom_weights),
+        ScoringEngine(kb.condition_names, kb.symptom_weights, kb.condition_symptoms()),
+        ResponseTemplates(kb),
+    )
+
+
+# Current knowledge snapshot, loaded on first use
+def get_state():
+    global _state
+    if _state is None:
+        with _build_lock:
+            if _state is None:
+                _state = _build_state(load_knowledge())
+    return _state
+
+
+# Recompile the knowledge base if its source changed and swap in freshly
+# built indexes. Cached responses are dropped only if the content changed.
+def reload_knowledge():
+    global _state
+    with _build_lock:
+        state = _build_state(load_knowledge())
+        changed = _state is None or _state.kb.version != state.kb.version
+        _state = state
+    if changed:
+        response_cache.clear()
+    return state
+
+
+# Reload automatically whenever knowledge.json changes on disk
+def watch_knowledge(interval=2.0):
+    global _watcher
+    with _build_lock:
+        if _watcher is None:
+            _watcher = KnowledgeWatcher(reload_knowledge, interval=interval)
+            _watcher.start()
+    return _watcher
+
+
+# Reload on SIGHUP. Must be called from the main thread.
+def install_reload_signal():
+    import signal
+    signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(target=reload_knowledge).start())
+
+
+# Load the spaCy model and run a first parse, once per process (or once
+# per parser process when HEALTHBOT_NLP_WORKERS is set)
+def warm_up():
+    if nlp_service.WORKERS:
+        return nlp_service.get_nlp_service().warm_up()
+    return get_engine().warm_up()
+
+
+# Answer from greetings and condition names alone, None if nothing matched
+@metrics.timed('keyword_scan')
+def keyword_response(user_input, logged_in=False, state=None):
+    state = state or get_state()
+
+    # Find greetings and condition names in a single pass over the input
+    match = state.keyword_matcher.best_match(user_input.lower())
+
+    # Misspelled or split condition names ("migrane", "heart burn") win
+    # over a greeting or over a shorter exact hit such as "burn"
+    fuzzy_match = state.condition_fuzzy.best_match(user_input)
+    if fuzzy_match and (not match or match.kind != 'condition'
+                        or fuzzy_match.end - fuzzy_match.start > match.end - match.start):
+        return format_advice(fuzzy_match.key, state)
+
+    # Check for basic conversational responses
+    if match and match.kind == 'greeting':
+        if match.key == 'hello' and logged_in:
+            return "Welcome back!"
+        return state.kb.greetings[match.key]
+
+    # Check for detailed health advice
+    if match and match.kind == 'condition':
+        return format_advice(match.key, state)
+
+    return None
+
+
+# The full advice text for one condition, rendered when the knowledge
+# base was loaded
+@metrics.timed('format')
+def format_advice(condition, state=None):
+    state = state or get_state()
+    _request.condition = condition
+    return state.templates.advice(condition)
+
+
+# Answer from the symptoms extracted by the NLP engine, None if no
+# known symptom was found
+@metrics.timed('scoring')
+def symptom_response(extracted_symptoms, state=None):
+    state = state or get_state()
+
+    # Calculate a likelihood score for each condition based on symptom weights
+    return scored_response(state.scoring_engine.score(extracted_symptoms), state)
+
+
+# Answer from condition scores, None if nothing scored at all
+def scored_response(condition_scores, state):
+    if not any(condition_scores.values()):
+        return None
+
+    # Every condition scoring above the threshold, best first, or just the
+    # most likely one if none does
+    ranked = sorted((condition for condition, score in condition_scores.items() if score >= THRESHOLD),
+                    key=condition_scores.get, reverse=True)
+    if not ranked:
+        ranked = [max(condition_scores, key=condition_scores.get)]
+    _request.condition = ranked[0]
+    return state.templates.symptom_answer(ranked)
+
+
+# Tier 0: known symptoms named in the message, exactly or misspelled,
+# no parse needed
+@metrics.timed('symptom_keywords')
+def keyword_symptoms(user_input, state=None):
+    state = state or get_state()
+    symptoms = [match.key for match in state.symptom_matcher.find_longest(user_input)]
+    for match in state.symptom_fuzzy.match(user_input):
+        if match.key not in symptoms:
+            symptoms.append(match.key)
+    return symptoms
+
+
+# Tier 1: symptom phrases found by the spaCy matcher. These are rarely a
+# known symptom word for word (tier 0 would have found it), so see
+# resolve_symptoms for turning them into ones that score.
+def parsed_symptoms(user_input):
+    key = ' '.join(user_input.split())
+    extracted_symptoms = symptom_cache.get(key)
+    if extracted_symptoms is None:
+        with admission.nlp_gate:
+            extracted_symptoms = _parse(user_input)
+        symptom_cache.put(key, extracted_symptoms)
+    return list(extracted_symptoms)
+
+
+@metrics.timed('parse')
+def _parse(user_input):
+    if nlp_service.WORKERS:
+        return nlp_service.get_nlp_service().parse(user_input)
+    return get_engine().extract_symptoms(user_input)
+
+
+# Known symptoms for the phrases the parser found: a phrase that is one
+# already, or the closest one by n-gram similarity ("upset stomach" ->
+# "stomach ache"). Phrases that resolve to nothing are dropped; the
+# message then falls back to the full-text search.
+def resolve_symptoms(phrases, state):
+    known = state.scoring_engine.symptom_columns
+    unresolved = [phrase for phrase in phrases if phrase not in known]
+    resolved = dict(zip(unresolved, state.symptom_fuzzy.lookup(unresolved)))
+    symptoms = []
+    for phrase in phrases:
+        symptom = phrase if phrase in known else resolved[phrase]
+        if symptom is not None and symptom not in symptoms:
+            symptoms.append(symptom)
+    return symptoms
+
+
+def extract_symptoms(user_input, state=None):
+    state = state or get_state()
+    start = time.perf_counter()
+    extracted_symptoms = keyword_symptoms(user_input, state)
+    if extracted_symptoms:
+        tier_stats.record('keyword', time.perf_counter() - start)
+        return extracted_symptoms
+
+    extracted_symptoms = resolve_symptoms(parsed_symptoms(user_input), state)
+    tier_stats.record('parser', time.perf_counter() - start)
+    return extracted_symptoms
+
+
+# Messages from a username go through its rate limit first. When the
+# parser is saturated the message gets a cheap answer instead, which is
+# not cached.
+# With a SymptomContext, symptoms from earlier messages in the same
+# conversation count towards the answer as well. Every answer is also
+# queued for the query log, which never blocks.
+@metrics.timed('total')
+def get_response(user_input, logged_in=False, username=None, context=None):
+    start = time.perf_counter()
+    _request.stage, _request.condition, _request.cached = None, None, False
+    _request.cacheable = True
+    user_input = admission.limit_length(user_input)
+    response = _respond(user_input, logged_in, username, context)
+    if analytics.ENABLED:
+        query = normalize(user_input) if _request.stage in analytics.MISS_STAGES else None
+        analytics.record(username, _request.stage, _request.condition, time.perf_counter() - start,
+                         _request.cached, query)
+    return response
+
+
+def _respond(user_input, logged_in, username, context):
+    if username is not None and not admission.allow(username):
+        _request.stage = 'rate_limited'
+        return admission.RATE_LIMITED_RESPONSE
+
+    state = get_state()
+    if context is not None:
+        try:
+            return _contextual_response(user_input, logged_in, state, context)
+        except admission.Overloaded:
+            return degraded_response(user_input, state)
+
+    # Cached along with how it was answered, so hits are logged the same way
+    key = _cache_key(state, logged_in, tokenize(user_input))
+    cached = response_cache.get(key, _MISSING)
+    if cached is not _MISSING:
+        response, _request.stage, _request.condition = cached
+        _request.cached = True
+        return response
+    try:
+        response = _get_response(user_input, logged_in, state)
+    except admission.Overloaded:
+        return degraded_response(user_input, state)
+    if _request.cacheable:
+        response_cache.put(key, (response, _request.stage, _request.condition))
+    return response
+
+
+# Keyed on the same tokens the keyword matcher sees, stop words included:
+# "how are you today" is a greeting, "today" is not
+def _cache_key(state, logged_in, words):
+    return state.kb.version, logged_in, ' '.join(words)
+
+
+# The same answer as get_response, a paragraph at a time, for
+# st.write_stream. The whole answer is worked out first: streaming only
+# paces how it appears.
+def stream_response(user_input, logged_in=False, username=None, context=None):
+    yield from paragraphs(get_response(user_input, logged_in, username, context))
+
+
+def _get_response(user_input, logged_in, state):
+    response = keyword_response(user_input, logged_in, state)
+    if response is not None:
+        _count_response('keyword')
+        return response
+
+    # Extract symptoms from user input using NLP
+    return _scored_or_fallback(user_input, extract_symptoms(user_input.lower(), state), state)
+
+
+# Only the new message is parsed and added to the context; conditions are
+# then scored from everything the context holds. Greetings and questions
+# about a condition are answered as usual, but reporting a symptom that is
+# also a condition ("also a fever") after earlier symptoms gets the
+# combined assessment. Only symptoms the knowledge base scores are kept
+# in the context; other phrases the parser found ("feel dizzy") would
+# never count towards an answer. Keyword answers don't depend on the
+# context, so they share the response cache with get_response; answers
+# scored from the context are not cached.
+def _contextual_response(user_input, logged_in, state, context):
+    words = tokenize(user_input)
+    if ' '.join(words) in RESET_PHRASES:
+        context.reset()
+        _request.stage = 'reset'
+        return RESET_RESPONSE
+
+    known = state.scoring_engine.symptom_columns
+    key = _cache_key(state, logged_in, words)
+    cached = response_cache.get(key, _MISSING)
+    if cached is not _MISSING and cached[1] == 'keyword':
+        response = cached[0]
+    else:
+        cached = _MISSING
+        response = keyword_response(user_input, logged_in, state)
+    if response is None:
+        extracted_symptoms = [symptom for symptom in extract_symptoms(user_input.lower(), state) if symptom in known]
+    else:
+        extracted_symptoms = keyword_symptoms(user_input.lower(), state)
+        is_question = '?' in user_input or not QUESTION_WORDS.isdisjoint(words)
+        if is_question or not (extracted_symptoms and context):
+            if extracted_symptoms and not is_question:
+                context.observe(extracted_symptoms)
+            if cached is not _MISSING:
+                _, _request.stage, _request.condition = cached
+                _request.cached = True
+                return response
+            _count_response('keyword')
+            response_cache.put(key, (response, _request.stage, _request.condition))
+            return response
+
+    if not extracted_symptoms:
+        _count_response('fallback')
+        return fallback_response(user_input, state)
+
+    earlier = [symptom for symptom in context.symptoms() if symptom in known and symptom not in extracted_symptoms]
+    context.observe(extracted_symptoms)
+    response = scored_response(context.score(state.scoring_engine), state)
+    if response is None:
+        _count_response('fallback')
+        return fallback_response(user_input, state)
+    _count_response('symptoms')
+    if earlier:
+        response = f"Together with what you mentioned earlier ({', '.join(earlier)}):\n\n" + response
+    return response
+
+
+# Full-text search over the advice content for messages nothing else
+# understood, and a general response if even that finds nothing. The
+# general response is picked at random each time, so it isn't cached.
+@metrics.timed('fallback')
+def fallback_response(user_input, state=None):
+    state = state or get_state()
+    related = state.kb.search(user_input)
+    if not related:
+        _request.cacheable = False
+        return random.choice(state.kb.general_responses)
+    return related_topics(related)
+
+
+# Answer without the parser: related topics from the full-text search if
+# there are any, otherwise ask the user to come back
+def degraded_response(user_input, state):
+    related = state.kb.search(user_input)
+    _request.stage = 'degraded' if related else 'busy'
+    admission.count(_request.stage)
+    if not related:
+        return admission.BUSY_RESPONSE
+    return related_topics(related)
+
+
+def related_topics(related):
+    response = "I couldn't find an exact match, but these topics look related:\n"
+    for condition in related:
+        response += f"- {condition}\n"
+    response += "\nAsk me about any of them for more details."
+    return response
+
+
+def cache_stats():
+    return {'responses': response_cache.stats(), 'symptoms': symptom_cache.stats()}
+
+
+def nlp_tier_stats():
+    return tier_stats.snapshot()
+
+
+# Cache sizes for the metrics endpoint
+def _collect_metrics():
+    for name, stats in cache_stats().items():
+        yield ('healthbot_cache_size', 'Response engine cache size.', {'cache': name}, stats['size'])
+
+
+# Cache and tier hit counts, which only go up
+def _collect_counters():
+    for name, stats in cache_stats().items():
+        for field in ('hits', 'misses'):
+            yield (f'healthbot_cache_{field}_total', f'Response engine cache {field}.', {'cache': name}, stats[field])
+    for tier, stats in nlp_tier_stats().items():
+        yield ('healthbot_nlp_tier_hits_total', 'Messages resolved by each symptom extraction tier.', {'tier': tier},
+               stats['hits'])
+
+
+metrics.register_collector(_collect_metrics)
+metrics.register_collector(_collect_counters, kind='counter')
+
+
+# Answer many messages at once. Keyword hits are answered directly and
+# the rest are parsed together, through nlp.pipe or the shared parser
+# pool when there is one, in input order.
+def get_responses(messages, batch_size=64, n_process=1, logged_in=False):
+    engine = None if nlp_service.WORKERS else get_engine()
+    chunk = []
+    for message in messages:
+        chunk.append(message)
+        if len(chunk) >= batch_size * n_process:
+            yield from _respond_chunk(engine, chunk, batch_size, n_process, logged_in)
+            chunk = []
+    if chunk:
+        yield from _respond_chunk(engine, chunk, batch_size, n_process, logged_in)
+
+
+def _respond_chunk(engine, chunk, batch_size, n_process, logged_in):
+    state = get_state()
+    responses = [keyword_response(message, logged_in, state) for message in chunk]
+
+    # Messages that name a known symptom skip the parse
+    pending = []
+    for i, response in enumerate(responses):
+        if response is None:
+            extracted_symptoms = keyword_symptoms(chunk[i].lower(), state)
+            if extracted_symptoms:
+                responses[i] = _scored_or_fallback(chunk[i], extracted_symptoms, state)
+            else:
+                pending.append(i)
+
+    texts = [chunk[i].lower() for i in pending]
+    for i, extracted_symptoms in zip(pending, _parse_many(engine, texts, batch_size, n_process)):
+        responses[i] = _scored_or_fallback(chunk[i], resolve_symptoms(extracted_symptoms, state), state)
+    return responses
+
+
+# With parser processes the texts are queued to the shared pool, which
+# batches them alongside single messages; otherwise nlp.pipe here
+def _parse_many(engine, texts, batch_size, n_process):
+    if engine is None:
+        service = nlp_service.get_nlp_service()
+        return [future.result() for future in [service.submit(text) for text in texts]]
+    return engine.pipe(texts, batch_size=batch_size, n_process=n_process)
+
+
+def _scored_or_fallback(user_input, extracted_symptoms, state):
+    response = symptom_response(extracted_symptoms, state)
+    if response is not None:
+        _count_response('symptoms')
+        return response
+    _count_response('fallback')
+    return fallback_response(user_input, state)
+
+
+# Count which stage produced each uncached response
+_response_counters = {
+    path: metrics.counter('healthbot_responses_total', 'Uncached responses by the stage that produced them.', path=path)
+    for path in ('keyword', 'symptoms', 'fallback')
+}
+
+
+def _count_response(path):
+    _request.stage = path
+    if metrics.ENABLED:
+        _response_counters[path].inc()
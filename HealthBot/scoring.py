@@ -0,0 +1,137 @@
+import numpy as np
+
+
+# Known symptoms mentioned in a condition's free-text symptom description
+def match_symptoms(text, symptoms):
+    text = text.lower()
+    return [symptom for symptom in symptoms if symptom in text]
+
+
+# Precomputed condition scoring.
+# Built once from the knowledge base: a condition x symptom weight matrix
+# so a query scores every condition in one operation.
+class ScoringEngine:
+    def __init__(self, conditions, symptom_weights, condition_symptoms):
+        self.conditions = list(conditions)
+        self.symptoms = list(symptom_weights)
+        self.symptom_columns = {symptom: i for i, symptom in enumerate(self.symptoms)}
+
+        self.weights = np.zeros((len(self.conditions), len(self.symptoms)), dtype=np.float32)
+        for row, condition in enumerate(self.conditions):
+            for symptom in condition_symptoms.get(condition, ()):
+                column = self.symptom_columns.get(symptom)
+                if column is None:
+                    continue
+                self.weights[row, column] = symptom_weights[symptom]
+
+    # Columns for the known symptoms in a query, unknown spans are skipped
+    def columns(self, symptoms):
+        columns = {self.symptom_columns.get(symptom.lower()) for symptom in symptoms}
+        columns.discard(None)
+        return sorted(columns)
+
+    # Score every condition at once, returns a vector aligned with self.conditions
+    def score_vector(self, symptoms):
+        columns = self.columns(symptoms)
+        if not columns:
+            return np.zeros(len(self.conditions), dtype=np.float32)
+        return self.weights[:, columns].sum(axis=1)
+
+    def score(self, symptoms):
+        return dict(zip(self.conditions, self.score_vector(symptoms).tolist()))
+
+    # Scores for symptoms held with different strengths (symptom -> factor)
+    def score_weighted(self, strengths):
+        known = [(self.symptom_columns[symptom], strength) for symptom, strength in strengths.items()
+                 if symptom in self.symptom_columns]
+        if not known:
+            return dict.fromkeys(self.conditions, 0.0)
+        columns, factors = zip(*known)
+        vector = self.weights[:, list(columns)] @ np.array(factors, dtype=np.float32)
+        return dict(zip(self.conditions, vector.tolist()))
+
+
+# Running condition scores for a set of symptoms that changes one at a
+# time. Adding or removing a symptom adds or subtracts its weight column
+# instead of rescoring the whole selection.
+class SymptomTally:
+    def __init__(self, engine):
+        self.engine = engine
+        self.symptoms = set()
+        self.scores = np.zeros(len(engine.conditions), dtype=np.float32)
+
+    def add(self, symptom):
+        column = self.engine.symptom_columns.get(symptom)
+        if column is not None and symptom not in self.symptoms:
+            self.symptoms.add(symptom)
+            self.scores += self.engine.weights[:, column]
+
+    def remove(self, symptom):
+        column = self.engine.symptom_columns.get(symptom)
+        if column is not None and symptom in self.symptoms:
+            self.symptoms.discard(symptom)
+            self.scores -= self.engine.weights[:, column]
+            if not self.symptoms:
+                # Don't let rounding leave anything behind
+                self.scores[:] = 0
+
+    # Bring the tally in line with a new selection, touching only the difference
+    def update(self, selection):
+        selection = set(selection)
+        for symptom in self.symptoms - selection:
+            self.remove(symptom)
+        for symptom in selection - self.symptoms:
+            self.add(symptom)
+
+    # Highest scoring conditions as (condition, score) pairs, zero scores left out
+    def top(self, k=5):
+        k = min(k, len(self.scores))
+        if k == 0:
+            return []
+        candidates = np.argpartition(-self.scores, k - 1)[:k]
+        ranked = candidates[np.argsort(-self.scores[candidates], kind='stable')]
+        return [(self.engine.conditions[i], float(self.scores[i])) for i in ranked if self.scores[i] > 0]
+
+
+# Symptoms a user has mentioned over a conversation, as a sparse map of
+# symptom -> strength. Each time a message mentions symptoms they are added
+# at full strength and the older ones fade by DECAY, being dropped once they
+# fall below MIN_STRENGTH, so a cough from many messages ago stops counting.
+class SymptomContext:
+    DECAY = 0.7
+    MIN_STRENGTH = 0.2
+
+    def __init__(self, strengths=None):
+        self.strengths = dict(strengths or {})
+
+    # Fade what was there and add the newly mentioned symptoms
+    def observe(self, symptoms):
+        faded = {}
+        for symptom, strength in self.strengths.items():
+            strength = round(strength * self.DECAY, 3)
+            if strength >= self.MIN_STRENGTH:
+                faded[symptom] = strength
+        for symptom in symptoms:
+            faded[symptom.lower()] = 1.0
+        self.strengths = faded
+
+    def reset(self):
+        self.strengths = {}
+
+    def __bool__(self):
+        return bool(self.strengths)
+
+    # Strongest first
+    def symptoms(self):
+        return sorted(self.strengths, key=self.strengths.get, reverse=True)
+
+    def score(self, engine):
+        return engine.score_weighted(self.strengths)
+
+    # Plain dict for storing with the session (JSON-friendly)
+    def to_dict(self):
+        return dict(self.strengths)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data)
@@ -0,0 +1,258 @@
+import argparse
+import asyncio
+import json
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import admission
+import assets
+import metrics
+import responder
+
+MAX_BODY = 1024 * 1024
+KEEP_ALIVE_TIMEOUT = 15
+# Most texts one /respond/batch request may carry
+MAX_BATCH_TEXTS = 64
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# A response body sent as is, with its own content type and headers
+class RawResponse:
+    def __init__(self, body, content_type, headers=None):
+        self.body = body
+        self.content_type = content_type
+        self.headers = headers or {}
+
+
+# Minimal HTTP/1.1 JSON service around the response engine.
+# Parsing runs on a fixed-size thread pool, and a semaphore of the same
+# size keeps callers waiting on the event loop instead of piling up jobs
+# in the executor queue. Every caller is rate limited by address, and
+# batches go through the same length limit and parser gate as single
+# messages, a small nlp.pipe batch at a time.
+class HealthBotServer:
+    def __init__(self, workers=4, batch_size=16):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='healthbot-nlp')
+        self.slots = asyncio.Semaphore(workers)
+        self.batch_size = batch_size
+        self.routes = {
+            ('GET', '/health'): self.health,
+            ('GET', '/metrics'): self.metrics,
+            ('POST', '/respond'): self.respond,
+            ('POST', '/respond/batch'): self.respond_batch,
+        }
+
+    async def run_in_executor(self, func, *args):
+        async with self.slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+
+    async def health(self, payload, client):
+        return {'status': 'ok'}
+
+    # Prometheus text format; plain strings are sent as text/plain
+    async def metrics(self, payload, client):
+        return metrics.render_prometheus()
+
+    # Built images (see assets.py). Their names carry a content hash, so
+    # they are sent with long-lived cache headers and an ETag.
+    def static_file(self, filename, if_none_match=None):
+        asset = assets.find(filename)
+        if asset is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f'no asset {filename}')
+        etag = f'"{filename}"'
+        headers = {'Cache-Control': assets.CACHE_CONTROL, 'ETag': etag}
+        if if_none_match == etag:
+            return HTTPStatus.NOT_MODIFIED, RawResponse(b'', asset.content_type, headers)
+        return HTTPStatus.OK, RawResponse(asset.data, asset.content_type, headers)
+
+    async def respond(self, payload, client):
+        text = payload.get('text')
+        if not isinstance(text, str):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "'text' must be a string")
+        username = payload.get('username')
+        if username is not None and not isinstance(username, str):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "'username' must be a string")
+        if not admission.allow_client(client):
+            raise HTTPError(HTTPStatus.TOO_MANY_REQUESTS, admission.RATE_LIMITED_RESPONSE)
+        response = await self.run_in_executor(responder.get_response, text, bool(payload.get('logged_in')), username)
+        return {'response': response}
+
+    async def respond_batch(self, payload, client):
+        texts = payload.get('texts')
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "'texts' must be a list of strings")
+        if len(texts) > MAX_BATCH_TEXTS:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"at most {MAX_BATCH_TEXTS} texts per batch")
+        if not admission.allow_client(client, max(len(texts), 1)):
+            raise HTTPError(HTTPStatus.TOO_MANY_REQUESTS, admission.RATE_LIMITED_RESPONSE)
+        texts = [admission.limit_length(text) for text in texts]
+        try:
+            responses = await self.run_in_executor(self.batch_responses, texts, bool(payload.get('logged_in')))
+        except admission.Overloaded:
+            admission.count('busy')
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, admission.BUSY_RESPONSE)
+        return {'responses': responses}
+
+    def batch_responses(self, texts, logged_in):
+        with admission.nlp_gate:
+            return list(responder.get_responses(texts, batch_size=self.batch_size, logged_in=logged_in))
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+                keep_alive = await self.handle_request(request_line, reader, writer)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except ValueError:
+            # A request or header line longer than the stream's limit
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, request_line, reader, writer):
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            method, path, version = request_line.decode('latin-1').split()
+        except ValueError:
+            await self.send(writer, HTTPStatus.BAD_REQUEST, {'error': 'malformed request line'}, False)
+            return False
+
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+
+        # Until the body has been read, the connection can't be reused:
+        # whatever is left of it would be taken for the next request
+        body_read = False
+        try:
+            if 'transfer-encoding' in headers:
+                raise HTTPError(HTTPStatus.NOT_IMPLEMENTED, 'only Content-Length bodies are supported')
+            try:
+                length = int(headers.get('content-length', 0))
+            except ValueError:
+                length = -1
+            if length < 0:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, 'invalid Content-Length')
+            if length > MAX_BODY:
+                raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'request body too large')
+            body = await reader.readexactly(length) if length else b''
+            body_read = True
+            path = path.split('?')[0]
+            if method == 'GET' and path.startswith('/static/'):
+                status, result = self.static_file(path[len('/static/'):], headers.get('if-none-match'))
+                await self.send(writer, status, result, keep_alive)
+                return keep_alive
+            handler = self.routes.get((method, path))
+            if handler is None:
+                raise HTTPError(HTTPStatus.NOT_FOUND, f'no route for {method} {path}')
+            try:
+                payload = json.loads(body) if body else {}
+            except ValueError:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, 'body is not valid JSON')
+            if not isinstance(payload, dict):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, 'body must be a JSON object')
+            status, result = HTTPStatus.OK, await handler(payload, self.client_address(writer))
+        except HTTPError as e:
+            status, result = e.status, {'error': str(e)}
+        except (ConnectionError, asyncio.IncompleteReadError):
+            raise
+        except Exception:
+            # A bug or a broken engine (missing model, dead parser process):
+            # answer anyway, and don't trust this connection any further
+            traceback.print_exc()
+            status, result = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': 'internal server error'}
+            body_read = False
+
+        keep_alive = keep_alive and body_read
+        await self.send(writer, status, result, keep_alive)
+        return keep_alive
+
+    @staticmethod
+    def client_address(writer):
+        peer = writer.get_extra_info('peername')
+        return peer[0] if isinstance(peer, tuple) else str(peer)
+
+    async def send(self, writer, status, result, keep_alive):
+        extra_headers = ''
+        if isinstance(result, RawResponse):
+            body = result.body
+            content_type = result.content_type
+            extra_headers = ''.join(f"{name}: {value}\r\n" for name, value in result.headers.items())
+        elif isinstance(result, str):
+            body = result.encode('utf-8')
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            body = json.dumps(result).encode('utf-8')
+            content_type = 'application/json'
+        head = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            f"{extra_headers}"
+            "\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    # Listen on host:port, or on an already bound socket (see launcher.py)
+    async def serve(self, host=None, port=None, sock=None):
+        if sock is not None:
+            server = await asyncio.start_server(self.handle_connection, sock=sock)
+            host, port = sock.getsockname()[:2]
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"HealthBot API listening on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve HealthBot responses over HTTP.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=4, help="threads running the NLP parse")
+    parser.add_argument('--batch-size', type=int, default=16,
+                        help="texts of a batch request parsed together; other requests get a turn in between")
+    args = parser.parse_args(argv)
+
+    # Load the model before accepting connections
+    responder.warm_up()
+
+    # Rebuild the knowledge base when knowledge.json changes or on SIGHUP
+    responder.get_state()
+    responder.watch_knowledge()
+    responder.install_reload_signal()
+
+    async def run():
+        await HealthBotServer(args.workers, args.batch_size).serve(args.host, args.port)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+import abc
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+
+import metrics
+import user_store
+
+# How long a session lives without being used, in seconds
+SESSION_TTL = int(os.environ.get('HEALTHBOT_SESSION_TTL', 12 * 60 * 60))
+# How long a session lives at most, however often it is used. The token
+# travels in the page URL, so a copied link stops working after this.
+SESSION_MAX_AGE = int(os.environ.get('HEALTHBOT_SESSION_MAX_AGE', 24 * 60 * 60))
+# Expiry is pushed back at most this often, so reads don't turn into writes
+TOUCH_INTERVAL = 60
+# How often expired sessions are swept out of the store
+GC_INTERVAL = 10 * 60
+# Recent chat messages kept with the session
+CONTEXT_SIZE = 10
+# Signing secret shared by all processes. When unset the SQLite store keeps
+# a generated one in its database file.
+SESSION_SECRET = os.environ.get('HEALTHBOT_SESSION_SECRET')
+
+_expired = metrics.counter('healthbot_sessions_expired_total', 'Sessions removed after expiring.')
+
+
+# Session tokens are "<id>.<signature>". The signature lets a worker throw
+# out forged or mangled tokens without a lookup, and the store only keeps a
+# hash of the id, so a copy of the database can't be used to log in.
+def sign(session_id, secret):
+    return hmac.new(secret, session_id.encode(), hashlib.sha256).hexdigest()
+
+
+def split_token(token, secret):
+    session_id, _, signature = (token or '').partition('.')
+    if session_id and hmac.compare_digest(signature, sign(session_id, secret)):
+        return session_id
+    return None
+
+
+def _key(session_id):
+    return hashlib.sha256(session_id.encode()).hexdigest()
+
+
+# Interface every session store provides. A session is a dict with the
+# username, a JSON-serialisable data dict, its expiry time and when it was
+# created. Use keeps pushing the expiry back, but never past max_age after
+# creation.
+class SessionStore(abc.ABC):
+    ttl = SESSION_TTL
+    max_age = SESSION_MAX_AGE
+
+    def __init__(self, secret):
+        self.secret = secret
+        self._last_gc = 0.0
+
+    def create(self, username, data=None):
+        session_id = secrets.token_urlsafe(24)
+        now = time.time()
+        self._insert(_key(session_id), username, data or {}, now + min(self.ttl, self.max_age), now)
+        self._maybe_gc()
+        return f"{session_id}.{sign(session_id, self.secret)}"
+
+    # The session for a token, or None if it is forged, unknown or expired
+    def get(self, token):
+        session_id = split_token(token, self.secret)
+        if session_id is None:
+            return None
+        key = _key(session_id)
+        session = self._load(key)
+        if session is None:
+            return None
+        now = time.time()
+        last_expiry = session['created_at'] + self.max_age
+        if session['expires_at'] <= now or last_expiry <= now:
+            self._delete(key)
+            _expired.inc()
+            return None
+        expires_at = min(now + self.ttl, last_expiry)
+        if expires_at - session['expires_at'] > TOUCH_INTERVAL:
+            session['expires_at'] = expires_at
+            self._touch(key, expires_at)
+        return session
+
+    def save(self, token, data):
+        session_id = split_token(token, self.secret)
+        return session_id is not None and self._save(_key(session_id), data)
+
+    def delete(self, token):
+        session_id = split_token(token, self.secret)
+        if session_id is not None:
+            self._delete(_key(session_id))
+
+    # Set some fields of the session's data, keeping the rest
+    def update(self, token, **values):
+        session = self.get(token)
+        if session is None:
+            return False
+        session['data'].update(values)
+        return self.save(token, session['data'])
+
+    # Append a chat message to the session's recent context
+    def add_context(self, token, role, content):
+        session = self.get(token)
+        if session is None:
+            return False
+        context = session['data'].get('context', [])
+        context.append({"role": role, "content": content})
+        session['data']['context'] = context[-CONTEXT_SIZE:]
+        return self.save(token, session['data'])
+
+    def _maybe_gc(self):
+        now = time.time()
+        if now - self._last_gc >= GC_INTERVAL:
+            self._last_gc = now
+            self.gc()
+
+    # Remove expired sessions, returns how many went
+    def gc(self):
+        removed = self._remove_expired(time.time())
+        _expired.inc(removed)
+        return removed
+
+    @abc.abstractmethod
+    def _insert(self, key, username, data, expires_at, created_at):
+        pass
+
+    @abc.abstractmethod
+    def _load(self, key):
+        pass
+
+    @abc.abstractmethod
+    def _save(self, key, data):
+        pass
+
+    @abc.abstractmethod
+    def _touch(self, key, expires_at):
+        pass
+
+    @abc.abstractmethod
+    def _delete(self, key):
+        pass
+
+    @abc.abstractmethod
+    def _remove_expired(self, now):
+        pass
+
+
+# Sessions in one process's memory; for tests and single-process setups
+class MemorySessionStore(SessionStore):
+    def __init__(self, secret=None):
+        super().__init__(secret or secrets.token_bytes(32))
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _insert(self, key, username, data, expires_at, created_at):
+        with self._lock:
+            self._sessions[key] = {'username': username, 'data': json.loads(json.dumps(data)),
+                                   'expires_at': expires_at, 'created_at': created_at}
+
+    def _load(self, key):
+        with self._lock:
+            session = self._sessions.get(key)
+            return json.loads(json.dumps(session)) if session else None
+
+    def _save(self, key, data):
+        with self._lock:
+            if key not in self._sessions:
+                return False
+            self._sessions[key]['data'] = json.loads(json.dumps(data))
+            return True
+
+    def _touch(self, key, expires_at):
+        with self._lock:
+            if key in self._sessions:
+                self._sessions[key]['expires_at'] = expires_at
+
+    def _delete(self, key):
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def _remove_expired(self, now):
+        with self._lock:
+            expired = [key for key, session in self._sessions.items() if session['expires_at'] <= now]
+            for key in expired:
+                del self._sessions[key]
+        return len(expired)
+
+
+# Sessions in a SQLite file that any number of app processes can share.
+# The signing secret lives in the same file, so every process that opens
+# it agrees on it without any extra configuration.
+class SQLiteSessionStore(SessionStore):
+    def __init__(self, path=user_store.DB_PATH, secret=None):
+        self.pool = user_store.get_pool(path)
+        with self.pool.connection() as conn:
+            with conn:
+                conn.execute('''CREATE TABLE IF NOT EXISTS sessions (
+                                id TEXT PRIMARY KEY,
+                                username TEXT NOT NULL,
+                                data TEXT NOT NULL,
+                                expires_at REAL NOT NULL,
+                                created_at REAL NOT NULL DEFAULT 0
+                            )''')
+                # Tables from before created_at: their sessions read as too old and expire
+                columns = [row[1] for row in conn.execute('PRAGMA table_info(sessions)')]
+                if 'created_at' not in columns:
+                    conn.execute('ALTER TABLE sessions ADD COLUMN created_at REAL NOT NULL DEFAULT 0')
+                conn.execute('CREATE INDEX IF NOT EXISTS sessions_by_expiry ON sessions (expires_at)')
+                conn.execute('CREATE TABLE IF NOT EXISTS session_secret (id INTEGER PRIMARY KEY CHECK (id = 0), secret BLOB NOT NULL)')
+                conn.execute('INSERT OR IGNORE INTO session_secret (id, secret) VALUES (0, ?)', (secrets.token_bytes(32),))
+            stored = conn.execute('SELECT secret FROM session_secret').fetchone()[0]
+        super().__init__(secret or stored)
+
+    def _insert(self, key, username, data, expires_at, created_at):
+        with self.pool.connection() as conn:
+            with conn:
+                conn.execute('INSERT INTO sessions (id, username, data, expires_at, created_at) VALUES (?, ?, ?, ?, ?)',
+                             (key, username, json.dumps(data), expires_at, created_at))
+
+    def _load(self, key):
+        with self.pool.connection() as conn:
+            row = conn.execute('SELECT username, data, expires_at, created_at FROM sessions WHERE id = ?',
+                               (key,)).fetchone()
+        if row is None:
+            return None
+        return {'username': row[0], 'data': json.loads(row[1]), 'expires_at': row[2], 'created_at': row[3]}
+
+    def _save(self, key, data):
+        with self.pool.connection() as conn:
+            with conn:
+                return conn.execute('UPDATE sessions SET data = ? WHERE id = ?', (json.dumps(data), key)).rowcount > 0
+
+    def _touch(self, key, expires_at):
+        with self.pool.connection() as conn:
+            with conn:
+                conn.execute('UPDATE sessions SET expires_at = ? WHERE id = ?', (expires_at, key))
+
+    def _delete(self, key):
+        with self.pool.connection() as conn:
+            with conn:
+                conn.execute('DELETE FROM sessions WHERE id = ?', (key,))
+
+    def _remove_expired(self, now):
+        with self.pool.connection() as conn:
+            with conn:
+                return conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (now,)).rowcount
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+# The process-wide store, SQLite in users.db unless another one was set
+def get_session_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SQLiteSessionStore(secret=SESSION_SECRET.encode() if SESSION_SECRET else None)
+    return _store
+
+
+# Plug in a different store (e.g. one backed by a shared cache service)
+def set_session_store(store):
+    global _store
+    with _store_lock:
+        _store = store
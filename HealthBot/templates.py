@@ -0,0 +1,41 @@
+from knowledge import ADVICE_FIELDS
+
+CONSULT = "It's important to consult a healthcare professional for a proper diagnosis and treatment plan."
+
+
+# Markdown answers for every condition, rendered once per knowledge base
+# version, so answers are put together from them without formatting
+# anything per request.
+class ResponseTemplates:
+    def __init__(self, kb):
+        self.sections = {}
+        self.advice_text = {}
+        self.bullets = {}
+        for name in kb.condition_names:
+            record = kb.condition(name)
+            self.sections[name] = ''.join(f"**{field.capitalize()}:** {record[field]}\n\n"
+                                          for field in ADVICE_FIELDS if record.get(field))
+            self.advice_text[name] = f"Here's what I know about {name}:\n\n" + self.sections[name]
+            self.bullets[name] = f"- **{name.title()}**: {record['symptoms']}\n"
+
+    # The full advice for one condition
+    def advice(self, name):
+        return self.advice_text[name]
+
+    # Answer for scored symptoms: the advice for a single condition, or a
+    # short list when several fit about as well
+    def symptom_answer(self, ranked):
+        if len(ranked) == 1:
+            return f"Based on your symptoms, the most likely condition is: {ranked[0]}\n\n" + self.sections[ranked[0]]
+        return ("Based on your symptoms, you might have:\n\n"
+                + ''.join(self.bullets[name] for name in ranked)
+                + "\n" + CONSULT)
+
+
+# Split a finished answer back into paragraphs for streaming
+def paragraphs(text):
+    parts = text.split('\n\n')
+    for part in parts[:-1]:
+        yield part + '\n\n'
+    if parts[-1]:
+        yield parts[-1]
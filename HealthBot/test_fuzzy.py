@@ -0,0 +1,37 @@
+import pytest
+
+import responder
+
+
+@pytest.fixture(scope='module')
+def state():
+    return responder.get_state()
+
+
+@pytest.mark.parametrize('text', ["my backpack is heavy", "I need toothpaste", "good appetite", "my throat",
+                                  "morning sickness", "sickness", "stomach", "my stomach is full",
+                                  "I have stomach cramps"])
+def test_partial_words_do_not_match_conditions(state, text):
+    assert state.condition_fuzzy.match(text) == []
+
+
+@pytest.mark.parametrize('text', ["my backpack is heavy", "good appetite", "my throat", "sickness", "stomach",
+                                  "my stomach is full"])
+def test_partial_words_do_not_match_symptoms(state, text):
+    assert state.symptom_fuzzy.match(text) == []
+
+
+@pytest.mark.parametrize('text, key', [("migrane", 'migraine'), ("heart burn", 'heartburn'),
+                                       ("stomachache", 'stomach ache'), ("sore throte", 'sore throat'),
+                                       ("food poisonning", 'food poisoning')])
+def test_misspellings_still_match(state, text, key):
+    assert state.condition_fuzzy.best_match(text).key == key
+
+
+def test_greeting_not_overridden_by_partial_word(state):
+    assert responder.keyword_response("thanks for the toothpaste", state=state) == state.kb.greetings['thanks']
+
+
+def test_greeting_not_overridden_by_body_part(state):
+    response = responder.keyword_response("my stomach is fine now, thanks", state=state)
+    assert response == state.kb.greetings['thanks']
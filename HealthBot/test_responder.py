@@ -0,0 +1,68 @@
+import pytest
+
+import responder
+from scoring import SymptomContext
+
+
+# Answer without spaCy: the parse finds nothing, so messages without a
+# keyword go to the fallback
+@pytest.fixture(autouse=True)
+def no_parser(monkeypatch):
+    monkeypatch.setattr(responder, '_parse', lambda user_input: [])
+    monkeypatch.setattr(responder.analytics, 'ENABLED', False)
+    responder.response_cache.clear()
+    responder.symptom_cache.clear()
+    yield
+    responder.response_cache.clear()
+
+
+def test_stop_words_do_not_merge_cache_keys():
+    state = responder.get_state()
+    fallback = responder.get_response("today")
+    assert fallback in state.kb.general_responses
+    assert responder.get_response("how are you today") == state.kb.greetings['how are you']
+
+
+def test_cached_greeting_not_served_for_other_message():
+    state = responder.get_state()
+    assert responder.get_response("how are you today") == state.kb.greetings['how are you']
+    assert responder.get_response("today") in state.kb.general_responses
+
+
+def test_general_response_not_cached():
+    responder.get_response("today")
+    responder.get_response("today")
+    assert responder.response_cache.stats()['size'] == 0
+
+
+def test_keyword_answer_cached():
+    first = responder.get_response("Hello!")
+    assert responder.get_response("hello") == first
+    assert responder.response_cache.stats()['hits'] >= 1
+
+
+def test_parsed_phrases_resolve_to_known_symptoms():
+    state = responder.get_state()
+    phrases = ['fever', 'feel nauseous', 'have headaches', 'feel dizzy', 'cold hands']
+    assert responder.resolve_symptoms(phrases, state) == ['fever', 'nausea', 'headache']
+
+
+def test_parse_contributes_to_scoring(monkeypatch):
+    monkeypatch.setattr(responder, '_parse', lambda user_input: ['have headaches'])
+    assert responder.extract_symptoms("my head is killing me") == ['headache']
+
+
+def test_questions_in_a_conversation_are_cached():
+    context = SymptomContext()
+    first = responder.get_response("what is flu", context=context)
+    hits = responder.response_cache.stats()['hits']
+    assert responder.get_response("what is flu", context=context) == first
+    assert responder.response_cache.stats()['hits'] == hits + 1
+
+
+def test_context_answers_not_taken_from_cache():
+    context = SymptomContext()
+    responder.get_response("I have a cough", context=context)
+    responder.get_response("fever", context=SymptomContext())
+    response = responder.get_response("fever", context=context)
+    assert response.startswith("Together with what you mentioned earlier (cough)")
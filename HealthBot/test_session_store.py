@@ -0,0 +1,55 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from session_store import SQLiteSessionStore
+
+
+# Each call runs in its own process with its own connection to the file
+def create(path, username):
+    return SQLiteSessionStore(path).create(username, {'page': 'chat'})
+
+
+def get(path, token):
+    session = SQLiteSessionStore(path).get(token)
+    return session and (session['username'], session['data'])
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'users.db')
+
+
+@pytest.fixture(scope='module')
+def executor():
+    with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context('spawn')) as executor:
+        yield executor
+
+
+def test_session_created_in_one_process_read_in_another(path, executor):
+    token = executor.submit(create, path, 'alice').result()
+    assert executor.submit(get, path, token).result() == ('alice', {'page': 'chat'})
+    assert get(path, token) == ('alice', {'page': 'chat'})
+
+
+def test_processes_share_the_signing_secret(path, executor):
+    tokens = [executor.submit(create, path, f'user{i}').result() for i in range(4)]
+    assert [get(path, token)[0] for token in tokens] == ['user0', 'user1', 'user2', 'user3']
+
+
+def test_expired_session_not_served(path, executor):
+    store = SQLiteSessionStore(path)
+    store.ttl = 0
+    token = store.create('alice')
+    assert executor.submit(get, path, token).result() is None
+
+
+def test_forged_token_rejected(path, executor):
+    token = executor.submit(create, path, 'alice').result()
+    session_id, _, signature = token.partition('.')
+    forged = f"{session_id}.{'0' * len(signature)}"
+    assert executor.submit(get, path, forged).result() is None
+    assert executor.submit(get, path, session_id).result() is None
+    other = SQLiteSessionStore(path, secret=b'not the stored secret')
+    assert executor.submit(get, path, other.create('mallory')).result() is None
@@ -0,0 +1,166 @@
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from hashlib import sha256
+
+import metrics
+
+DB_PATH = 'users.db'
+POOL_SIZE = 8
+BUSY_TIMEOUT_MS = 5000
+
+
+# Small pool of long-lived SQLite connections shared between threads.
+# Connections are opened lazily up to the pool size; each one runs in WAL
+# mode so readers don't block the writer, and keeps its own cache of
+# prepared statements.
+class ConnectionPool:
+    def __init__(self, path=DB_PATH, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                               cached_statements=64)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._opened < self.size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._opened = 0
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+# One pool per database file, and the schema is set up when it is created
+def get_pool(path=DB_PATH):
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(path)
+            if pool is None:
+                pool = ConnectionPool(path)
+                _init_schema(pool)
+                _pools[path] = pool
+    return pool
+
+
+def _init_schema(pool):
+    with pool.connection() as conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS users (
+                        username TEXT PRIMARY KEY,
+                        password TEXT NOT NULL
+                    )''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS messages (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        username TEXT NOT NULL,
+                        role TEXT NOT NULL,
+                        content TEXT NOT NULL,
+                        created_at REAL NOT NULL
+                    )''')
+        conn.execute('CREATE INDEX IF NOT EXISTS messages_by_user ON messages (username, id)')
+        conn.commit()
+
+
+# Initialize SQLite database (only does work the first time per process)
+def init_db(path=DB_PATH):
+    return get_pool(path)
+
+
+# Hash password
+def hash_password(password):
+    return sha256(password.encode()).hexdigest()
+
+
+# Check user credentials
+@metrics.timed('check_user', 'healthbot_db_seconds', 'Time spent in user store calls.')
+def check_user(username, password, path=DB_PATH):
+    with get_pool(path).connection() as conn:
+        row = conn.execute('SELECT password FROM users WHERE username = ?', (username,)).fetchone()
+    return bool(row) and row[0] == hash_password(password)
+
+
+# Register a new user
+@metrics.timed('register_user', 'healthbot_db_seconds', 'Time spent in user store calls.')
+def register_user(username, password, path=DB_PATH):
+    with get_pool(path).connection() as conn:
+        try:
+            with conn:
+                conn.execute('INSERT INTO users (username, password) VALUES (?, ?)',
+                             (username, hash_password(password)))
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+
+# Load many (username, password) pairs in a single transaction. Existing
+# usernames are left alone; returns how many accounts were added.
+def bulk_register(users, path=DB_PATH):
+    rows = ((username, hash_password(password)) for username, password in users)
+    with get_pool(path).connection() as conn:
+        with conn:
+            before = conn.total_changes
+            conn.executemany('INSERT OR IGNORE INTO users (username, password) VALUES (?, ?)', rows)
+            return conn.total_changes - before
+
+
+# Append a chat message to a user's history, returns its id
+@metrics.timed('add_message', 'healthbot_db_seconds', 'Time spent in user store calls.')
+def add_message(username, role, content, path=DB_PATH):
+    with get_pool(path).connection() as conn:
+        with conn:
+            cursor = conn.execute('INSERT INTO messages (username, role, content, created_at) VALUES (?, ?, ?, ?)',
+                                  (username, role, content, time.time()))
+            return cursor.lastrowid
+
+
+# One page of a user's history, oldest first. Pass the id of the oldest
+# message already shown as before_id to get the page before it.
+def recent_messages(username, limit=20, before_id=None, path=DB_PATH):
+    with get_pool(path).connection() as conn:
+        if before_id is None:
+            rows = conn.execute('SELECT id, role, content FROM messages WHERE username = ? '
+                                'ORDER BY id DESC LIMIT ?', (username, limit)).fetchall()
+        else:
+            rows = conn.execute('SELECT id, role, content FROM messages WHERE username = ? AND id < ? '
+                                'ORDER BY id DESC LIMIT ?', (username, before_id, limit)).fetchall()
+    return [{"id": id, "role": role, "content": content} for id, role, content in reversed(rows)]